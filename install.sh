@@ -17,5 +17,7 @@ install -v -m 755 $BASE_PATH/orac-bonnet-bridge/OracBonnetBridge.py /usr/local/b
 install -v -m 755 $BASE_PATH/orac-bonnet-bridge/pixel_arial_11.ttf /usr/local/bin/
 install -v -m 755 $BASE_PATH/orac-bonnet-bridge/images/oracsplash.ppm /usr/local/bin/images/
 install -v -m 755 $BASE_PATH/orac-bonnet-bridge/images/oractitle.ppm /usr/local/bin/images/
+python3 -m compileall /usr/local/bin/OracBonnetBridge.py
+python3 /usr/local/bin/OracBonnetBridge.py --build-splash /usr/local/bin/images/oracsplash.ppm
 systemctl daemon-reload
 udevadm control --reload
@@ -26,58 +26,1100 @@
 import sys
 import os
 import threading
-
-import board
-import busio
-from PIL import Image, ImageDraw, ImageFont
-import adafruit_ssd1306
-
-import RPi.GPIO as GPIO
-GPIO.setmode(GPIO.BCM)
+import socket
+import struct
+import signal
 
 import argparse
+import json
+import mmap
+import traceback
 import random
-from threading import Timer
+import heapq
+from itertools import count
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from enum import IntEnum
-from time import sleep
+from time import sleep, monotonic, perf_counter
 
-from pythonosc.dispatcher import Dispatcher
-from pythonosc.osc_server import ThreadingOSCUDPServer
-from pythonosc import osc_message_builder
-from pythonosc import udp_client
+# PIL, asyncio and pythonosc are slow to import on a Pi, so they are only imported where they are used,
+# after the splash screen is up.
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--ip", default="127.0.0.1", help="The IP of the Orac Display server")
 parser.add_argument("--port", type=int, default=6100, help="The port the Orac Display server is listening on")
 parser.add_argument("--listen", type=int, default=6111, help="The default port to listen for responses.")
-args = parser.parse_args()
+parser.add_argument("--osc-engine", choices=["asyncio", "threading"], default="asyncio", help="Handle OSC input on one asyncio event loop, or with a thread per datagram.")
+parser.add_argument("--settle", type=float, default=0.2, help="How long to wait for Orac to finish redrawing after a clear, in seconds.")
+parser.add_argument("--quiet", type=float, default=0.01, help="How long OSC input must pause before a burst of changes is shown, in seconds.")
+parser.add_argument("--send-rate", type=float, default=50.0, help="How many times per second queued parameter changes are sent to Orac.")
+parser.add_argument("--debounce", type=float, default=0.02, help="How long a button has to be stable before a press or release counts, in seconds.")
+parser.add_argument("--repeat-delay", type=float, default=0.4, help="How long a button is held before it starts repeating, in seconds.")
+parser.add_argument("--repeat-interval", type=float, default=0.08, help="The time between repeats of a held button, in seconds.")
+parser.add_argument("--display", choices=["ssd1306", "memory"], default="ssd1306", help="Drive the SSD1306 over I2C, or an in-memory framebuffer (headless).")
+parser.add_argument("--input", choices=["gpio", "fake"], default="gpio", help="Read the buttons with RPi.GPIO, or from a scriptable fake (headless).")
+parser.add_argument("--renderer", choices=["direct", "pil"], default="direct", help="Draw straight into the display buffer, or through PIL (reference).")
+parser.add_argument("--row-cache", type=int, default=64, help="The number of rendered menu rows to keep cached.")
+parser.add_argument("--page-cache", type=int, default=32, help="The number of parameter pages to keep cached, to show them straight away when revisited.")
+parser.add_argument("--fps", type=float, default=30.0, help="The maximum number of display refreshes per second.")
+parser.add_argument("--marquee-fps", type=float, default=15.0, help="How many times per second a long selected row scrolls a step.")
+parser.add_argument("--bar-fps", type=float, default=60.0, help="The maximum number of parameter bar refreshes per second.")
+parser.add_argument("--dim-after", type=float, default=60.0, help="Dim the display after this many seconds without a button press or change from Orac, 0 never dims.")
+parser.add_argument("--off-after", type=float, default=300.0, help="Switch the display off, and stop rendering, after this many idle seconds, 0 never switches it off.")
+parser.add_argument("--state", metavar="FILE", help="Keep a snapshot of what Orac last showed in FILE, and show it straight away at startup.")
+parser.add_argument("--state-interval", type=float, default=30.0, help="How often the --state snapshot is saved when it has changed, in seconds.")
+parser.add_argument("--heartbeat", type=float, default=15.0, help="Send /Connect again when Orac has been silent this long, backing off while it stays silent, 0 never does.")
+parser.add_argument("--export", metavar="FILE", nargs="?", const="/dev/shm/orac-bonnet-bridge", help="Publish the frame and state shown to FILE, for other processes to map (default FILE /dev/shm/orac-bonnet-bridge).")
+parser.add_argument("--config", metavar="FILE", help="Run several displays and Oracs from one process, as described in FILE (see README.md).")
+parser.add_argument("--midi", choices=["mido", "fake"], help="Control the params with MIDI CCs, through mido (ALSA sequencer), or a scriptable fake (headless).")
+parser.add_argument("--midi-port", help="The MIDI input to open (default a virtual input called Orac Bonnet Bridge, to connect to with aconnect).")
+parser.add_argument("--midi-channel", type=int, choices=range(1, 17), metavar="1-16", help="Only listen to this MIDI channel (default all of them).")
+parser.add_argument("--midi-cc", type=lambda ccs: [int(cc) for cc in ccs.split(",")], default=[21, 22, 23, 24, 25, 26, 27, 28],
+                    help="The CC numbers of the eight params, comma separated (default 21,22,...,28).")
+parser.add_argument("--midi-rate", type=float, default=100.0, help="How many times per second MIDI changes are applied, only the latest value of each param is kept in between.")
+parser.add_argument("--record", metavar="FILE", help="Record every datagram received from Orac to FILE, for OracReplay.py.")
+parser.add_argument("--splash", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "oracsplash.bin"), help="The precomputed splash screen to show at startup.")
+parser.add_argument("--build-splash", metavar="IMAGE", help="Convert IMAGE into the --splash file and exit, done by install.sh.")
+parser.add_argument("--stats", metavar="FILE", help="Where to write the latency stats on SIGUSR1 and exit (default stdout).")
+parser.add_argument("--bench-dispatch", action="store_true", help="Compare OSC dispatch cost against the pythonosc Dispatcher and exit.")
+
+
+class Display:
+    SET_COL_ADDR = 0x21
+    SET_PAGE_ADDR = 0x22
+    SET_CONTRAST = 0x81
+    SET_DISPLAY_OFF = 0xAE
+    SET_DISPLAY_ON = 0xAF
+
+    def __init__(self, width=128, height=64):
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+
+        # Page-format framebuffer, with the I2C data control byte up front like adafruit_ssd1306.
+        self.buffer = bytearray(1 + self.pages * width)
+        self.buffer[0] = 0x40
+
+    def command(self, *commands):
+        raise NotImplementedError
+
+    def data(self, data):
+        raise NotImplementedError
+
+    def present(self):
+        pass
+
+    def fill(self, colour):
+        value = 0xFF if colour else 0x00
+        for i in range(1, len(self.buffer)):
+            self.buffer[i] = value
+
+    def image(self, image):
+        pixels = image.load()
+        for page in range(self.pages):
+            offset = 1 + page * self.width
+            for x in range(self.width):
+                bits = 0
+                for bit in range(8):
+                    if pixels[x, page * 8 + bit]:
+                        bits |= 1 << bit
+                self.buffer[offset + x] = bits
+
+    def show(self):
+        self.command(self.SET_COL_ADDR, 0, self.width - 1, self.SET_PAGE_ADDR, 0, self.pages - 1)
+        self.data(self.buffer)
+
+    def writeRegion(self, page, first, last, frame):
+        self.command(self.SET_COL_ADDR, first, last, self.SET_PAGE_ADDR, page, page)
+
+        offset = page * self.width
+        data = bytearray(last - first + 2)
+        data[0] = 0x40
+        data[1:] = frame[offset + first:offset + last + 1]
+        self.data(data)
+
+
+class SSD1306Display(Display):
+    # Displays on the same I2C bus share it, bus 1 is the one on the header's SDA and SCL pins.
+    buses = {}
+
+    def __init__(self, width=128, height=64, address=0x3C, bus=1):
+        import adafruit_ssd1306
+
+        super().__init__(width, height)
+        self.oled = adafruit_ssd1306.SSD1306_I2C(width, height, SSD1306Display.openBus(bus), addr=address)
+        self.buffer = self.oled.buffer
+
+    @staticmethod
+    def openBus(bus):
+        i2c = SSD1306Display.buses.get(bus)
+        if i2c is None:
+            if bus == 1:
+                import board
+                import busio
+                i2c = busio.I2C(board.SCL, board.SDA)
+            else:
+                from adafruit_extended_bus import ExtendedI2C
+                i2c = ExtendedI2C(bus)
+            SSD1306Display.buses[bus] = i2c
+        return i2c
+
+    def command(self, *commands):
+        for command in commands:
+            self.oled.write_cmd(command)
+
+    def data(self, data):
+        with self.oled.i2c_device:
+            self.oled.i2c_device.write(data)
+
+    def image(self, image):
+        self.oled.image(image)
+
+    def show(self):
+        self.oled.show()
+
+
+class MemoryDisplay(Display):
+
+    def __init__(self, width=128, height=64):
+        super().__init__(width, height)
+
+        # What the panel would be showing, and every flush as (timestamp, bytes sent).
+        self.ram = bytearray(self.pages * width)
+        self.flushes = []
+        self.pendingBytes = 0
+        self.commands = []
+        self.window = (0, width - 1, 0, self.pages - 1)
+        self.contrast = 0xCF
+        self.on = True
+
+    def command(self, *commands):
+        self.commands.extend(commands)
+        self.pendingBytes += 2 * len(commands)
+
+        pending = self.commands
+        while pending:
+            if pending[0] in (self.SET_COL_ADDR, self.SET_PAGE_ADDR):
+                if len(pending) < 3:
+                    return
+                first, last = pending[1], pending[2]
+                if pending[0] == self.SET_COL_ADDR:
+                    self.window = (first, last) + self.window[2:]
+                else:
+                    self.window = self.window[:2] + (first, last)
+                del pending[:3]
+            elif pending[0] == self.SET_CONTRAST:
+                if len(pending) < 2:
+                    return
+                self.contrast = pending[1]
+                del pending[:2]
+            else:
+                if pending[0] in (self.SET_DISPLAY_OFF, self.SET_DISPLAY_ON):
+                    self.on = pending[0] == self.SET_DISPLAY_ON
+                del pending[:1]
+
+    def data(self, data):
+        self.pendingBytes += len(data)
+        firstColumn, lastColumn, firstPage, lastPage = self.window
+        payload = memoryview(data)[1:]
+        i = 0
+        for page in range(firstPage, lastPage + 1):
+            for column in range(firstColumn, lastColumn + 1):
+                if i == len(payload):
+                    return
+                self.ram[page * self.width + column] = payload[i]
+                i += 1
+
+    def present(self):
+        self.flushes.append((monotonic(), self.pendingBytes))
+        self.pendingBytes = 0
+
+    def pixel(self, x, y):
+        return (self.ram[(y // 8) * self.width + x] >> (y % 8)) & 1
+
+
+class FakeGPIO:
+    BCM = 11
+    IN = 1
+    PUD_UP = 22
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.levels = {}
+        self.detect = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self.levels[pin] = FakeGPIO.HIGH if pull_up_down == FakeGPIO.PUD_UP else FakeGPIO.LOW
+
+    def input(self, pin):
+        return self.levels.get(pin, FakeGPIO.HIGH)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.detect[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self.detect.pop(pin, None)
+
+    def cleanup(self, *pins):
+        self.detect.clear()
+
+    def setLevel(self, pin, level):
+        previous = self.levels.get(pin, FakeGPIO.HIGH)
+        self.levels[pin] = level
+        edge, callback = self.detect.get(pin, (None, None))
+        if previous == level or callback is None:
+            return
+        if edge == FakeGPIO.BOTH or (edge == FakeGPIO.FALLING) == (level == FakeGPIO.LOW):
+            callback(pin)
+
+    def press(self, pin):
+        self.setLevel(pin, FakeGPIO.LOW)
+
+    def release(self, pin):
+        self.setLevel(pin, FakeGPIO.HIGH)
+
+    # Plays [(delay, pin, level), ...] on its own thread, like RPi.GPIO's callback thread.
+    def play(self, script):
+        def run():
+            for delay, pin, level in script:
+                sleep(delay)
+                self.setLevel(pin, level)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeMidi:
+
+    def __init__(self):
+        self.callback = None
+
+    def open(self, callback):
+        self.callback = callback
+
+    def close(self):
+        self.callback = None
+
+    def control(self, cc, value, channel=0):
+        if self.callback is not None:
+            self.callback(cc, value, channel)
+
+    # Plays [(delay, cc, value), ...] on its own thread, like mido's callback thread.
+    def play(self, script, channel=0):
+        def run():
+            for delay, cc, value in script:
+                if delay:
+                    sleep(delay)
+                self.control(cc, value, channel)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+class MidoMidi:
+
+    def __init__(self, port=None):
+        self.portName = port
+        self.port = None
+
+    def open(self, callback):
+        import mido
+
+        def receive(message):
+            if message.type == "control_change":
+                callback(message.control, message.value, message.channel)
+
+        if self.portName is None:
+            self.port = mido.open_input("Orac Bonnet Bridge", virtual=True, callback=receive)
+        else:
+            self.port = mido.open_input(self.portName, callback=receive)
+
+    def close(self):
+        if self.port is not None:
+            self.port.close()
+
+
+def createDisplay(name, address=0x3C, bus=1):
+    if name == "memory":
+        return MemoryDisplay()
+    return SSD1306Display(address=address, bus=bus)
+
+
+def createMidi(name, port=None):
+    if name == "fake":
+        return FakeMidi()
+    return MidoMidi(port)
+
+
+def createGpio(name):
+    if name == "fake":
+        return FakeGPIO()
+    import RPi.GPIO as GPIO
+    return GPIO
+
+
+# The splash is stored as the display's raw page bytes, so it can be shown before PIL is loaded.
+def buildSplash(source, target):
+    from PIL import Image
+
+    display = MemoryDisplay()
+    image = Image.new('1', (display.width, display.height))
+    splash = Image.open(source).convert('1')
+    image.paste(splash, ((display.width - splash.width) // 2, (display.height - splash.height) // 2))
+    display.image(image)
+    with open(target, "wb") as file:
+        file.write(display.buffer[1:])
+
+
+def showSplash(oled, path):
+    try:
+        with open(path, "rb") as file:
+            frame = file.read()
+    except OSError:
+        return False
+    if len(frame) != len(oled.buffer) - 1:
+        return False
+
+    oled.buffer[1:] = frame
+    oled.show()
+    oled.present()
+    return True
+
+
+# How long ago the process was started by the kernel, so interpreter startup counts too.
+def timeSinceStart():
+    try:
+        with open("/proc/self/stat") as file:
+            stat = file.read()
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except OSError:
+        return None
+    # The start time is field 22, counting from the state after the parenthesised command name.
+    startTicks = int(stat.rsplit(")", 1)[1].split()[19])
+    return uptime - startTicks / os.sysconf("SC_CLK_TCK")
+
+
+# The kinds of event applied by the thread owning the UI state.
+class UiEvent(IntEnum):
+    OSC         = 0
+    BUTTON      = 1
+    TIMER       = 2
+    CALL        = 3
+    MIDI        = 4
+
+
+class LatencyHistogram:
+    # Microseconds, in quarter octave buckets above 8us.
+    BUCKETS = 128
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self.started = perf_counter()
+        self.current = array('L', [0]) * LatencyHistogram.BUCKETS
+        self.previous = array('L', [0]) * LatencyHistogram.BUCKETS
+        self.currentMax = 0.0
+        self.previousMax = 0.0
+
+    def record(self, seconds, now):
+        # Covers the last one to two windows, the oldest one is dropped as a new one starts.
+        if now - self.started >= self.window:
+            self.started = now
+            self.previous, self.current = self.current, array('L', [0]) * LatencyHistogram.BUCKETS
+            self.previousMax, self.currentMax = self.currentMax, 0.0
+
+        self.current[min(LatencyHistogram.bucket(int(seconds * 1e6)), LatencyHistogram.BUCKETS - 1)] += 1
+        if seconds > self.currentMax:
+            self.currentMax = seconds
+
+    @staticmethod
+    def bucket(us):
+        if us < 8:
+            return us
+        bits = us.bit_length()
+        return (bits - 2) * 4 + ((us >> (bits - 3)) & 3)
+
+    # The first microsecond value past the bucket.
+    @staticmethod
+    def limit(bucket):
+        if bucket < 8:
+            return bucket + 1
+        return (5 + bucket % 4) << (bucket // 4 - 1)
+
+    def summary(self):
+        buckets = [a + b for a, b in zip(self.current, self.previous)]
+        total = sum(buckets)
+        maximum = max(self.currentMax, self.previousMax) * 1000.0
+        percentiles = []
+        for p in (0.5, 0.9, 0.99):
+            seen = 0
+            for n, hits in enumerate(buckets):
+                seen += hits
+                if total and seen >= p * total:
+                    percentiles.append(min(LatencyHistogram.limit(n) / 1000.0, maximum))
+                    break
+            else:
+                percentiles.append(0.0)
+        return total, percentiles, maximum
+
+
+class LatencyTracer:
+    # From a datagram arriving to its change reaching the display:
+    #   queue     waiting for the OSC thread
+    #   dispatch  the OSC handlers
+    #   settle    waiting for the burst, or the screen redraw, to finish
+    #   notify    the change callbacks, the Controller updating the Menu
+    #   build     Menu building its rows
+    #   draw      rendering the rows into the display buffer
+    #   flush     sending the changes to the display
+    #   total     all of the above
+    STAGES = ("queue", "dispatch", "settle", "notify", "build", "draw", "flush", "total")
+
+    def __init__(self, window=60.0):
+        self.stages = dict((stage, LatencyHistogram(window)) for stage in LatencyTracer.STAGES)
+        self.lock = threading.Lock()
+        self.received = None
+        self.undrawn = None
+
+        # How long each kind of event takes to apply, and how many are waiting for the UI thread.
+        self.events = dict((kind, LatencyHistogram(window)) for kind in UiEvent)
+        self.depth = 0
+        self.maxDepth = 0
+
+    def queued(self):
+        with self.lock:
+            self.depth += 1
+            if self.depth > self.maxDepth:
+                self.maxDepth = self.depth
+
+    def dequeued(self):
+        with self.lock:
+            self.depth -= 1
+
+    def applied(self, kind, start):
+        end = perf_counter()
+        self.events[kind].record(end - start, end)
+
+    def record(self, stage, start, end=None):
+        if end is None:
+            end = perf_counter()
+        self.stages[stage].record(end - start, end)
+
+    # Set while a change is being handled, so only changes that end up redrawing the display are timed.
+    def changing(self, received):
+        self.received = received
+
+    # The oldest datagram behind a change that has not been drawn yet.
+    def dirtied(self):
+        received = self.received
+        if received is None:
+            return
+        with self.lock:
+            if self.undrawn is None or received < self.undrawn:
+                self.undrawn = received
+
+    def drawn(self):
+        with self.lock:
+            received = self.undrawn
+            self.undrawn = None
+        if received is not None:
+            self.record("total", received)
+
+    def report(self):
+        lines = ["%-9s %8s %9s %9s %9s %9s" % ("stage", "count", "p50 ms", "p90 ms", "p99 ms", "max ms")]
+        for stage in LatencyTracer.STAGES:
+            lines.append(self.summaryLine(stage, self.stages[stage]))
+        lines.append("")
+        lines.append("%-9s %8s %9s %9s %9s %9s" % ("event", "count", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+        for kind in UiEvent:
+            lines.append(self.summaryLine(kind.name.lower(), self.events[kind]))
+        lines.append("queue depth %d, max %d" % (self.depth, self.maxDepth))
+        return "\n".join(lines) + "\n"
+
+    def summaryLine(self, name, histogram):
+        total, percentiles, maximum = histogram.summary()
+        return "%-9s %8d %9.3f %9.3f %9.3f %9.3f" % ((name, total) + tuple(percentiles) + (maximum,))
+
+    def dump(self, path=None):
+        if path is None:
+            print(self.report(), end="")
+            return
+        temp = path + ".tmp"
+        with open(temp, "w") as file:
+            file.write(self.report())
+        os.replace(temp, path)
+
+
+# Always on, a frame or a datagram costs a handful of clock reads.
+latency = LatencyTracer()
+
+
+class FrameFlusher:
+    # Every command goes out as a control byte + command byte, data as one control byte + payload.
+    COMMAND_COST = 2
+    REGION_OVERHEAD = 6 * COMMAND_COST + 1
+
+    def __init__(self, oled, fullFlushRatio=0.5):
+        self.oled = oled
+        self.width = oled.width
+        self.pages = oled.height // 8
+        self.fullFlushCost = self.REGION_OVERHEAD + self.width * self.pages
+        self.fullFlushRatio = fullFlushRatio
+        self.lastFrame = None
+
+        self.bytesSent = 0
+        self.lastFrameBytes = 0
+        self.framesFlushed = 0
+        self.fullFlushes = 0
+
+        self.flushCallbacks = []
+
+    def invalidate(self):
+        self.lastFrame = None
+
+    # Called on the render thread with each frame sent to the display.
+    def addFlushCallback(self, cb):
+        self.flushCallbacks.append(cb)
+
+    def changedRegions(self, frame):
+        regions = []
+        last = self.lastFrame
+        for page in range(self.pages):
+            start = page * self.width
+            end = start + self.width
+            if frame[start:end] == last[start:end]:
+                continue
+            first = start
+            while frame[first] == last[first]:
+                first += 1
+            final = end - 1
+            while frame[final] == last[final]:
+                final -= 1
+            regions.append((page, first - start, final - start))
+        return regions
+
+    def flush(self):
+        frame = bytes(memoryview(self.oled.buffer)[1:])
+
+        if self.lastFrame is None:
+            regions = None
+        else:
+            regions = self.changedRegions(frame)
+            if not regions:
+                self.lastFrameBytes = 0
+                return 0
+            cost = sum(self.REGION_OVERHEAD + last - first + 1 for _, first, last in regions)
+            if cost >= self.fullFlushCost * self.fullFlushRatio:
+                regions = None
+
+        if regions is None:
+            self.oled.show()
+            sent = self.fullFlushCost
+            self.fullFlushes += 1
+        else:
+            sent = 0
+            for page, first, last in regions:
+                self.oled.writeRegion(page, first, last, frame)
+                sent += self.REGION_OVERHEAD + last - first + 1
+        self.oled.present()
+
+        self.lastFrame = frame
+        self.lastFrameBytes = sent
+        self.bytesSent += sent
+        self.framesFlushed += 1
+        for cb in self.flushCallbacks:
+            cb(frame)
+        return sent
+
+
+class RenderScheduler:
+
+    def __init__(self, maxFps=30.0, barFps=60.0, tickFps=15.0):
+        self.frameInterval = 1.0 / maxFps if maxFps > 0 else 0.0
+        self.barInterval = 1.0 / barFps if barFps > 0 else 0.0
+        self.tickInterval = 1.0 / tickFps if tickFps > 0 else 0.0
+        self.condition = threading.Condition()
+        self.dirtyMenus = set()
+        self.dirtyBars = set()
+        self.animated = set()
+        self.running = False
+        self.renderThread = None
+
+        # Power changes still to be made, and the menus switched off, which aren't rendered at all until switched back on.
+        self.powerChanges = {}
+        self.asleep = set()
+        self.lastFrame = 0.0
+        self.lastBars = 0.0
+        self.lastTick = 0.0
+
+    # Bars only touch their own corner of the display, so they can be redrawn more often than the whole frame.
+    def markDirty(self, menu, bars=False):
+        with self.condition:
+            if bars:
+                self.dirtyBars.add(menu)
+            else:
+                self.dirtyMenus.add(menu)
+            self.condition.notify()
+
+    # Animated menus are rendered again every tick, until they stop animating.
+    def animate(self, menu, animated):
+        with self.condition:
+            if animated:
+                self.animated.add(menu)
+            else:
+                self.animated.discard(menu)
+            self.condition.notify()
+
+    def setPower(self, menu, power):
+        with self.condition:
+            self.powerChanges[menu] = power
+            if power == Menu.Power.OFF:
+                self.asleep.add(menu)
+            else:
+                self.asleep.discard(menu)
+            self.condition.notify()
+
+    def run(self):
+        if self.renderThread is None or not self.renderThread.is_alive():
+            self.running = True
+            self.renderThread = threading.Thread(target=self.__run, daemon=True)
+            self.renderThread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.renderThread is not None and self.renderThread is not threading.current_thread():
+            self.renderThread.join()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                # Hold off until the frame interval has passed, so every change made meanwhile
+                # is coalesced into the same frame.
+                power = None
+                while True:
+                    if not self.running:
+                        return
+
+                    # A menu being woken is drawn straight away, before it's switched back on.
+                    if self.powerChanges:
+                        power = self.powerChanges
+                        self.powerChanges = {}
+                        menus = set(power) - self.asleep
+                        bars = set()
+                        break
+
+                    now = monotonic()
+                    animated = self.animated - self.asleep
+                    tickDue = self.lastTick + self.tickInterval
+                    if animated and now >= tickDue:
+                        self.dirtyMenus |= animated
+                        self.lastTick = now
+
+                    dirtyMenus = self.dirtyMenus - self.asleep
+                    dirtyBars = self.dirtyBars - self.asleep
+                    frameDue = self.lastFrame + self.frameInterval
+                    barsDue = self.lastBars + self.barInterval
+                    if dirtyMenus and now >= frameDue:
+                        menus = dirtyMenus
+                        bars = dirtyBars - menus
+                        break
+                    if dirtyBars and now >= barsDue:
+                        menus = set()
+                        bars = dirtyBars
+                        break
+
+                    deadlines = []
+                    if dirtyMenus:
+                        deadlines.append(frameDue)
+                    if dirtyBars:
+                        deadlines.append(barsDue)
+                    if animated:
+                        deadlines.append(tickDue)
+                    self.condition.wait(min(deadlines) - now if deadlines else None)
+
+                self.dirtyMenus -= menus
+                self.dirtyBars -= menus | bars
+
+            for menu in menus:
+                menu.render()
+            for menu in bars:
+                menu.renderBars()
+            if power:
+                for menu, level in power.items():
+                    menu.applyPower(level)
+            if menus:
+                self.lastFrame = monotonic()
+            self.lastBars = monotonic()
+
+
+class PilRenderer:
+
+    def __init__(self, oled, font):
+        from PIL import Image, ImageDraw
+
+        self.oled = oled
+        self.font = font
+        self.image = Image.new('1', (oled.width, oled.height))
+        self.draw = ImageDraw.Draw(self.image)
+
+    def render(self, rows, viewWidth):
+        self.draw.rectangle((-1, 11, self.oled.width+1, self.oled.height+1), outline=0, fill=0)
+
+        # Draw the Title option
+        self.draw.rectangle([0, 0, 127, 11], outline=1, fill=0)
+        self.draw.text((3, 1), Menu.TITLE, font=self.font, fill=1)
+
+        # Draw the Menu options
+        top = 11
+
+        for text, inverted, offset in rows:
+            fill = 1
+            if inverted:
+                self.draw.rectangle([0, top, viewWidth, top + 11], outline=0, fill=1)
+                fill = 0
+            if offset is None:
+                self.draw.text((3, top + 1), text, font=self.font, fill=fill)
+            else:
+                # The text repeats every strip width, so draw every copy that shows.
+                stripWidth = self.textWidth(text) + Menu.MARQUEE_GAP
+                x = 3 - offset - stripWidth
+                while x < self.oled.width:
+                    self.draw.text((x, top + 1), text, font=self.font, fill=fill)
+                    x += stripWidth
+            top += 10
+
+        self.oled.image(self.image)
+
+    def textWidth(self, text):
+        return sum(int(self.font.getlength(char)) for char in text)
+
+    def invalidate(self):
+        pass
+
+
+class GlyphAtlas:
+
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+        for code in range(32, 127):
+            self.glyph(chr(code))
+
+    def glyph(self, char):
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = self.rasterise(char)
+            self.glyphs[char] = glyph
+        return glyph
+
+    def rasterise(self, char):
+        from PIL import Image, ImageDraw
+
+        # Rasterise with PIL once, and keep each glyph as (advance, [(x offset, column bits)]).
+        left, _, right, bottom = self.font.getbbox(char)
+        pad = max(0, -left)
+        image = Image.new('1', (pad + max(right, 1), max(bottom, 1)))
+        ImageDraw.Draw(image).text((pad, 0), char, font=self.font, fill=1)
+
+        pixels = image.load()
+        columns = []
+        for x in range(image.width):
+            bits = 0
+            for y in range(image.height):
+                if pixels[x, y]:
+                    bits |= 1 << y
+            if bits:
+                columns.append((x - pad, bits))
+
+        return int(self.font.getlength(char)), columns
+
+    def textWidth(self, text):
+        return sum(self.glyph(char)[0] for char in text)
+
+    def textColumns(self, text, x, width):
+        columns = [0] * width
+        for char in text:
+            advance, glyphColumns = self.glyph(char)
+            for offset, bits in glyphColumns:
+                column = x + offset
+                if 0 <= column < width:
+                    columns[column] |= bits
+            x += advance
+        return columns
+
+
+# The values last used, by key, least recently used first, such as rendered rows or parameter pages.
+class LruCache:
+
+    def __init__(self, size=64):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Builds what isn't cached from the key, if there's a build.
+    def get(self, key, build=None):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        if build is None:
+            return None
+        value = build(*key)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def stats(self):
+        return "%d hits, %d misses, %d evictions" % (self.hits, self.misses, self.evictions)
+
+
+class PageRenderer:
+    ROW_BITS = (1 << 12) - 1
+
+    def __init__(self, oled, font, cacheSize=64):
+        self.oled = oled
+        self.width = oled.width
+        self.pages = oled.height // 8
+        self.frameMask = (1 << oled.height) - 1
+        self.atlas = GlyphAtlas(font)
+        self.rowCache = LruCache(cacheSize)
+        self.strips = LruCache(8)
+
+        # The frame is kept as one integer per column, bit n being pixel row n.
+        self.columns = [0] * self.width
+        self.title = self.titleLayer()
+
+        # The (layer, top) pairs the frame was last composed from.
+        self.layers = None
+
+    def invalidate(self):
+        self.layers = None
+
+    def titleLayer(self):
+        text = self.atlas.textColumns(Menu.TITLE, 3, self.width)
+        outline = [self.ROW_BITS if x in (0, 127) else (1 | 1 << 11) for x in range(self.width)]
+        return [self.ROW_BITS] * self.width, [outline[x] | text[x] << 1 for x in range(self.width)]
+
+    def textWidth(self, text):
+        return self.atlas.textWidth(text)
+
+    def rowLayer(self, text, inverted, viewWidth):
+        return self.layer(self.atlas.textColumns(text, 3, self.width), inverted, viewWidth)
+
+    # A long row is rasterised once as a strip that repeats after a gap, and scrolled by taking a window of it.
+    def stripColumns(self, text):
+        width = self.atlas.textWidth(text) + Menu.MARQUEE_GAP
+        wide = self.atlas.textColumns(text, width, 3 * width)
+        return [wide[x] | wide[x + width] | wide[x + 2 * width] for x in range(width)]
+
+    def marqueeLayer(self, text, inverted, viewWidth, offset):
+        strip = self.strips.get((text,), self.stripColumns)
+        start = offset - 3
+        width = len(strip)
+        return self.layer([strip[(start + x) % width] for x in range(self.width)], inverted, viewWidth)
+
+    def layer(self, textBits, inverted, viewWidth):
+        if not inverted:
+            return None, [bits << 1 for bits in textBits]
+
+        # A filled rectangle with a 0 outline, with the text knocked out of it.
+        clear = [self.ROW_BITS if x <= viewWidth else 0 for x in range(self.width)]
+        fill = [(self.ROW_BITS & ~(1 | 1 << 11)) if 0 < x < viewWidth else 0 for x in range(self.width)]
+        return clear, [fill[x] & ~(textBits[x] << 1) for x in range(self.width)]
+
+    def compose(self, layer, top, columns):
+        clear, bits = layer
+        mask = self.frameMask
+        if clear is None:
+            for x in range(self.width):
+                columns[x] |= (bits[x] << top) & mask
+        else:
+            for x in range(self.width):
+                columns[x] = ((columns[x] & ~(clear[x] << top)) | (bits[x] << top)) & mask
+
+    def render(self, rows, viewWidth):
+        layers = [(self.title, 0)]
+        top = 11
+        for text, inverted, offset in rows:
+            if offset is None:
+                layers.append((self.rowCache.get((text, inverted, viewWidth), self.rowLayer), top))
+            else:
+                layers.append((self.marqueeLayer(text, inverted, viewWidth, offset), top))
+            top += 10
+
+        previous = self.layers
+        self.layers = layers
+        if previous is None or len(previous) != len(layers):
+            self.columns = [0] * self.width
+            for layer, top in layers:
+                self.compose(layer, top, self.columns)
+            self.toPages(self.oled.buffer, range(self.pages))
+            return
+
+        # Only the pixel rows under layers that changed are composed again, from every layer over them.
+        dirty = 0
+        for (layer, top), (old, _) in zip(layers, previous):
+            if layer is not old:
+                dirty |= self.ROW_BITS << top
+        dirty &= self.frameMask
+        if not dirty:
+            return
+
+        columns = [0] * self.width
+        for layer, top in layers:
+            if (self.ROW_BITS << top) & dirty:
+                self.compose(layer, top, columns)
+        keep = self.frameMask & ~dirty
+        self.columns = [(old & keep) | (new & dirty) for old, new in zip(self.columns, columns)]
+        self.toPages(self.oled.buffer, [page for page in range(self.pages) if (dirty >> (page * 8)) & 0xFF])
+
+    def toPages(self, buffer, pages):
+        # Lay the columns out column-major, then every page is a strided slice of that.
+        columnMajor = b''.join(bits.to_bytes(self.pages, 'little') for bits in self.columns)
+        for page in pages:
+            offset = 1 + page * self.width
+            buffer[offset:offset + self.width] = columnMajor[page::self.pages]
 
-# Create the I2C interface.
-i2c = busio.I2C(board.SCL, board.SDA)
-oled = adafruit_ssd1306.SSD1306_I2C(128, 64, i2c)
-oled.fill(0)
-oled.show()
+
+# What the render thread draws, published whole by the UI thread and never changed after.
+class MenuFrame:
+    __slots__ = ("options", "highlightOption", "firstVisible", "bars", "viewWidth")
+
+    def __init__(self, options, highlightOption, firstVisible, bars, viewWidth):
+        self.options = tuple(options)
+        self.highlightOption = highlightOption
+        self.firstVisible = firstVisible
+        self.bars = dict(bars)
+        self.viewWidth = viewWidth
 
 
 class Menu:
+    TITLE = "           O   R   A   C "
+
+    # The rows that fit under the title, the rest of the options are scrolled into view.
+    VISIBLE_ROWS = 5
+
+    class Power(IntEnum):
+        ON          = 0
+        DIM         = 1
+        OFF         = 2
+
+    CONTRAST = 0xCF
+    DIM_CONTRAST = 0x08
 
-    def __init__(self, options=[]):
-        self.options = options
+    # A selected row too long for the view scrolls sideways, after a pause, wrapping round after a gap.
+    MARQUEE_GAP = 24
+    MARQUEE_PAUSE = 1.0
+    MARQUEE_SPEED = 30.0
+
+    def __init__(self, oled, scheduler, options=[], renderer="direct", rowCacheSize=64):
+        self.scheduler = scheduler
+        self.options = list(options)
         self.highlightOption = None
+        self.firstVisible = 0
 
-        self.oled = adafruit_ssd1306.SSD1306_I2C(128, 64, i2c)
+        # The parameter bars to the right of the rows, as option: (value, inverted), while the view is narrowed.
+        self.bars = {}
 
-        self.image = Image.new('1', (self.oled.width, self.oled.height))
-        
-        self.draw = ImageDraw.Draw(self.image)
-        self.font = ImageFont.truetype(os.path.dirname(__file__) + '/pixel_arial_11.ttf', 8)
+        # The text of the scrolling row, and when it started.
+        self.marquee = None
+        self.marqueeStart = 0.0
+
+        self.oled = oled
+
+        self.flusher = FrameFlusher(self.oled)
+
+        # The font and renderer are loaded on first use, or ahead of it by prepare().
+        self.rendererName = renderer
+        self.rowCacheSize = rowCacheSize
+        self.renderer = None
+        self.rendererLock = threading.Lock()
 
-        self.renderThread = None
         self.viewWidth = 128
-        
+
+        # Only the UI thread changes the menu, the render thread only sees the frames it publishes.
+        self.holds = 0
+        self.heldDirty = False
+        self.heldBars = False
+        self.publish()
+
+    def prepare(self):
+        with self.rendererLock:
+            if self.renderer is None:
+                from PIL import ImageFont
+
+                font = ImageFont.truetype(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pixel_arial_11.ttf'), 8)
+                if self.rendererName == "pil":
+                    self.renderer = PilRenderer(self.oled, font)
+                else:
+                    self.renderer = PageRenderer(self.oled, font, self.rowCacheSize)
+        return self.renderer
+
+    def publish(self):
+        self.frame = MenuFrame(self.options, self.highlightOption, self.firstVisible, self.bars, self.viewWidth)
+
+    def markDirty(self):
+        latency.dirtied()
+        if self.holds:
+            self.heldDirty = True
+            return
+        self.publish()
+        self.scheduler.markDirty(self)
+
+    def markBarsDirty(self):
+        if self.holds:
+            self.heldBars = True
+            return
+        self.publish()
+        self.scheduler.markDirty(self, bars=True)
+
+    # Groups several changes into a single frame, nothing is published until the outermost batch ends.
+    @contextmanager
+    def batch(self):
+        self.holds += 1
+        try:
+            yield self
+        finally:
+            self.holds -= 1
+            if self.holds == 0:
+                dirty, bars = self.heldDirty, self.heldBars
+                self.heldDirty = False
+                self.heldBars = False
+                if dirty or bars:
+                    self.publish()
+                if dirty:
+                    self.scheduler.markDirty(self)
+                elif bars:
+                    self.scheduler.markDirty(self, bars=True)
+
     def set_options(self, options=[]):
-        self.options = options
-        self.rowCount = len(options)
+        self.options = list(options)
+        self.scroll()
+        self.markDirty()
 
     def set_highlight(self, highlight):
         if highlight is None:
@@ -88,289 +1130,1234 @@ class Menu:
             self.highlightOption = len(self.options) - 1
         else:
             self.highlightOption = highlight
+        self.scroll()
+        self.markDirty()
+
+    def set_bar(self, option, value, inverted=False):
+        if value is None:
+            if self.bars.pop(option, None) is None:
+                return
+        else:
+            if self.bars.get(option) == (value, inverted):
+                return
+            self.bars[option] = (value, inverted)
+        self.markBarsDirty()
+
+    # Narrower than the display leaves room for the parameter bars.
+    def set_view_width(self, width):
+        self.viewWidth = width
+        self.bars = {}
+        self.markDirty()
+
+    # Dims or switches off the panel, once off nothing is rendered until it's switched back on.
+    def set_power(self, power):
+        self.scheduler.setPower(self, power)
+
+    # Moves the view as little as possible to keep the highlight in it.
+    def scroll(self):
+        first = self.firstVisible
+        highlight = self.highlightOption
+        if highlight is not None:
+            if highlight < first:
+                first = highlight
+            elif highlight >= first + Menu.VISIBLE_ROWS:
+                first = highlight - Menu.VISIBLE_ROWS + 1
+        self.firstVisible = max(0, min(first, len(self.options) - Menu.VISIBLE_ROWS))
 
     def blank(self, draw=False):
-        self.draw.rectangle((-1, 11, self.oled.width+1, self.oled.height+1), outline=0, fill=0)
         if draw:
-            self.draw.rectangle((-1, -1, self.oled.width+1, self.oled.height+1), outline=0, fill=0)
-            self.oled.image(self.image)
+            self.oled.fill(0)
             self.oled.show()
+            self.oled.present()
+            if self.renderer is not None:
+                self.renderer.invalidate()
+            self.flusher.invalidate()
+        else:
+            self.markDirty()
+
+    # Render and the rest run on the render thread, from the last frame published.
+    def render(self):
+        frame = self.frame
+        start = perf_counter()
+        renderer = self.renderer or self.prepare()
+        rows = self.__build(renderer, frame)
+        built = perf_counter()
+        renderer.render(rows, frame.viewWidth)
+        self.drawBars(frame)
+        drawn = perf_counter()
+        self.flusher.flush()
+
+        latency.record("build", start, built)
+        latency.record("draw", built, drawn)
+        latency.record("flush", drawn)
+        latency.drawn()
+
+    def renderBars(self):
+        self.drawBars(self.frame)
+        self.flusher.flush()
+
+    def applyPower(self, power):
+        if power == Menu.Power.OFF:
+            self.oled.command(Display.SET_DISPLAY_OFF)
+        else:
+            self.oled.command(Display.SET_CONTRAST, Menu.DIM_CONTRAST if power == Menu.Power.DIM else Menu.CONTRAST, Display.SET_DISPLAY_ON)
+        self.oled.present()
+
+    # Draws the bars straight into the display buffer, over whatever the renderer left right of the view.
+    def drawBars(self, frame):
+        oled = self.oled
+        left = frame.viewWidth + 2
+        if left >= oled.width:
+            return
+
+        columns = [0] * (oled.width - left)
+        interior = len(columns) - 4
+        bars = frame.bars
+        first = frame.firstVisible
+        for row in range(min(Menu.VISIBLE_ROWS, len(frame.options) - first)):
+            bar = bars.get(first + row)
+            if bar is None:
+                continue
+            value, inverted = bar
+            top = 11 + 10 * row
+            side = 0b111111 << (top + 3)
+            edge = 0b100001 << (top + 3)
+            fill = (0b1111 if inverted else 0b0110) << (top + 4)
+            filled = int(round(min(max(value, 0.0), 1.0) * interior))
+            columns[1] |= side
+            columns[-2] |= side
+            for x in range(2, 2 + interior):
+                columns[x] |= edge | (fill if x - 2 < filled else 0)
+
+        # Everything below the title's bottom edge is ours.
+        region = ((1 << oled.height) - 1) & ~((1 << 12) - 1)
+        buffer = oled.buffer
+        for page in range(1, oled.height // 8):
+            keep = ~(region >> (page * 8)) & 0xFF
+            offset = 1 + page * oled.width + left
+            for x, bits in enumerate(columns):
+                buffer[offset + x] = (buffer[offset + x] & keep) | ((bits >> (page * 8)) & 0xFF)
+
+    def __build(self, renderer, frame):
+        options = frame.options
+        highlightOption = frame.highlightOption
+        start = frame.firstVisible
+        end = min(start + Menu.VISIBLE_ROWS, len(options))
+
+        rows = [(options[x], highlightOption == x, None) for x in range(start, end)]
+        marquee = None
+        if highlightOption is not None and start <= highlightOption < end:
+            text = options[highlightOption]
+            if 3 + renderer.textWidth(text) > frame.viewWidth:
+                marquee = text
+                rows[highlightOption - start] = (text, True, self.marqueeOffset(text, renderer) or None)
+
+        if marquee != self.marquee:
+            self.marquee = marquee
+            self.scheduler.animate(self, marquee is not None)
+        return rows
+
+    def marqueeOffset(self, text, renderer):
+        now = monotonic()
+        if text != self.marquee:
+            self.marqueeStart = now
+        scrolled = now - self.marqueeStart - Menu.MARQUEE_PAUSE
+        if scrolled <= 0:
+            return 0
+        return int(scrolled * Menu.MARQUEE_SPEED) % (renderer.textWidth(text) + Menu.MARQUEE_GAP)
+        
+    def end(self):
+        self.scheduler.stop()
+        self.blank(True)
+        
+
+
+class OscRouter:
+
+    def __init__(self, defaultHandler=None):
+        from pythonosc import osc_packet
+
+        self.routes = {}
+        self.defaultHandler = defaultHandler
+        self.OscPacket = osc_packet.OscPacket
+        self.ParseError = osc_packet.ParseError
+
+    def map(self, address, handler, param=None):
+        self.routes[address] = (handler, param)
+
+    # Same entry point as pythonosc's Dispatcher, so either OSC server can drive it.
+    def call_handlers_for_packet(self, data, client_address):
+        try:
+            packet = self.OscPacket(data)
+        except self.ParseError:
+            return []
+
+        for timedMessage in packet.messages:
+            message = timedMessage.message
+            self.dispatch(message.address, message.params)
+        return []
+
+    def dispatch(self, address, params):
+        route = self.routes.get(address)
+        if route is None:
+            if self.defaultHandler is not None:
+                self.defaultHandler(address, *params)
+            return
+
+        handler, param = route
+        if param is None:
+            handler(address, *params)
+        else:
+            handler(param, *params)
+
+
+def benchmarkDispatch(iterations=2000):
+    from pythonosc.dispatcher import Dispatcher
+    from pythonosc import osc_message_builder
+
+    def ignore(*osc_arguments):
+        pass
+
+    dispatcher = Dispatcher()
+    for pattern in ("/text", "/selectText", "/clearText", "/P*Desc", "/P*Ctrl", "/P*Value", "/module", "/*"):
+        dispatcher.map(pattern, ignore)
+
+    router = OscRouter(ignore)
+    for address in ("/text", "/selectText", "/clearText", "/module"):
+        router.map(address, ignore)
+    for i in range(Orac.MAX_PARAMS):
+        for suffix in ("Desc", "Ctrl", "Value"):
+            router.map("/P%d%s" % (i+1, suffix), ignore, i)
+
+    # Roughly what Orac sends when a module is selected.
+    messages = [("/clearText", [])]
+    messages += [("/text", [i+1, "Line %d" % (i+1)]) for i in range(Orac.MAX_LINES)]
+    messages += [("/selectText", [1]), ("/module", ["a.Module"])]
+    for i in range(Orac.MAX_PARAMS):
+        messages += [("/P%dDesc" % (i+1), ["Param"]), ("/P%dValue" % (i+1), ["0.50"]), ("/P%dCtrl" % (i+1), [0.5])]
+    messages += [("/unknown", [1.0])]
+
+    datagrams = []
+    for address, values in messages:
+        builder = osc_message_builder.OscMessageBuilder(address=address)
+        for value in values:
+            builder.add_arg(value)
+        datagrams.append(builder.build().dgram)
+
+    for name, target in (("Dispatcher", dispatcher), ("OscRouter", router)):
+        start = perf_counter()
+        for _ in range(iterations):
+            for datagram in datagrams:
+                target.call_handlers_for_packet(datagram, None)
+        elapsed = perf_counter() - start
+        print("%-10s %8.2f us per message" % (name, elapsed * 1e6 / (iterations * len(datagrams))))
+
+    for name, lookup in (("Dispatcher", lambda address: list(dispatcher.handlers_for_address(address))), ("OscRouter", router.routes.get)):
+        start = perf_counter()
+        for _ in range(iterations):
+            for address, _ in messages:
+                lookup(address)
+        elapsed = perf_counter() - start
+        print("%-10s %8.2f us per address lookup" % (name, elapsed * 1e6 / (iterations * len(messages))))
+
+
+class TimerScheduler:
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.deadlines = []
+        self.timers = {}
+        self.jobs = deque()
+        self.sequence = count()
+        self.running = False
+        self.thread = None
+
+    def schedule(self, key, delay, callback, *args):
+        with self.condition:
+            deadline = monotonic() + delay
+            sequence = next(self.sequence)
+            self.timers[key] = (sequence, callback, args)
+            heapq.heappush(self.deadlines, (deadline, sequence, key))
+            self.condition.notify()
+
+    def cancel(self, key):
+        with self.condition:
+            self.timers.pop(key, None)
+
+    # Queues an event for the owning thread.
+    def post(self, kind, callback, *args):
+        latency.queued()
+        with self.condition:
+            self.jobs.append((kind, callback, args))
+            self.condition.notify()
+
+    # Applies an event already on the owning thread, which has to outlive any one event failing.
+    def apply(self, kind, callback, *args):
+        start = perf_counter()
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            latency.applied(kind, start)
+
+    def isOwner(self):
+        return threading.current_thread() is self.thread
 
     def run(self):
-        if self.renderThread is None or not self.renderThread.isAlive():
-            self.renderThread = threading.Thread(target=self.__run)
-            self.renderThread.start()
+        if self.thread is None or not self.thread.is_alive():
+            self.running = True
+            self.thread = threading.Thread(target=self.__run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def __next(self):
+        # Called with the condition held, returns the next due event or how long to wait for one.
+        if self.jobs:
+            latency.dequeued()
+            return self.jobs.popleft(), None
+
+        while self.deadlines:
+            deadline, sequence, key = self.deadlines[0]
+            timer = self.timers.get(key)
+            if timer is None or timer[0] != sequence:
+                # Cancelled or re-armed since.
+                heapq.heappop(self.deadlines)
+                continue
+            wait = deadline - monotonic()
+            if wait > 0:
+                return None, wait
+            heapq.heappop(self.deadlines)
+            del self.timers[key]
+            return (UiEvent.TIMER,) + timer[1:], None
+
+        return None, None
 
     def __run(self):
-        
-        self.blank()
-        self.__build()
-        self.oled.image(self.image)
-        self.oled.show()
+        while True:
+            with self.condition:
+                while True:
+                    if not self.running:
+                        return
+                    job, wait = self.__next()
+                    if job is not None:
+                        break
+                    self.condition.wait(wait)
+
+            kind, callback, args = job
+            self.apply(kind, callback, *args)
+
+
+class LoopScheduler:
 
-    def __build(self):
-        if (self.highlightOption is None) or (self.highlightOption < self.rowCount):
-            start = 0
-            end = self.rowCount
-        elif self.highlightOption >= (len(self.options) - self.rowCount):
-            end = len(self.options)
-            start = end - self.rowCount
+    def __init__(self, loop):
+        import asyncio
+
+        self.loop = loop
+        self.handles = {}
+        self.runningLoop = asyncio.get_running_loop
+
+    def schedule(self, key, delay, callback, *args):
+        if self.isOwner():
+            self.__arm(key, delay, callback, args)
         else:
-            start = self.highlightOption
-            end = start + self.rowCount
-        
-        # Draw the Title option
-        self.draw.rectangle([0, 0, 127, 11], outline=1, fill=0)
-        self.draw.text((3, 1), "           O   R   A   C ", font=self.font, fill=1)
-        
-        # Draw the Menu options
-        top = 11
-        
-        for x in range(start, end):
-            fill = 1
-            if self.highlightOption is not None and self.highlightOption == x:
-                self.draw.rectangle([0, top, self.viewWidth, top + 11], outline=0, fill=1)
-                fill = 0
-            self.draw.text((3, top + 1), self.options[x], font=self.font, fill=fill)
-            top += 10
-        
-    def end(self):
-        self.blank(True)
-        self.oled.image(self.image)
-        self.oled.show()
-        
+            self.loop.call_soon_threadsafe(self.__arm, key, delay, callback, args)
+
+    def cancel(self, key):
+        if self.isOwner():
+            self.__cancel(key)
+        else:
+            self.loop.call_soon_threadsafe(self.__cancel, key)
+
+    # Queues an event for the loop.
+    def post(self, kind, callback, *args):
+        latency.queued()
+        self.loop.call_soon_threadsafe(self.__posted, kind, callback, args)
+
+    # Applies an event already on the loop.
+    def apply(self, kind, callback, *args):
+        start = perf_counter()
+        try:
+            callback(*args)
+        finally:
+            latency.applied(kind, start)
+
+    def isOwner(self):
+        try:
+            return self.runningLoop() is self.loop
+        except RuntimeError:
+            return False
+
+    def run(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def __arm(self, key, delay, callback, args):
+        self.__cancel(key)
+        self.handles[key] = self.loop.call_later(delay, self.__fire, key, callback, args)
+
+    def __cancel(self, key):
+        handle = self.handles.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+
+    def __posted(self, kind, callback, args):
+        latency.dequeued()
+        self.apply(kind, callback, *args)
+
+    def __fire(self, key, callback, args):
+        del self.handles[key]
+        self.apply(UiEvent.TIMER, callback, *args)
+
+
+# One event loop on one thread, serving the OSC endpoints of every Orac in the process.
+class OscLoop:
+
+    def __init__(self):
+        import asyncio
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self.transports = {}
+
+    # Returns once the endpoint is bound, so whatever is sent to Orac from then on can be answered.
+    def serve(self, server):
+        import asyncio
+
+        self.run()
+        asyncio.run_coroutine_threadsafe(self.__serve(server), self.loop).result()
+
+    def unserve(self, server):
+        if self.isRunning():
+            self.loop.call_soon_threadsafe(self.__unserve, server)
+
+    def isRunning(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        if not self.isRunning():
+            self.thread = threading.Thread(target=self.__run)
+            self.thread.start()
+
+    def stop(self):
+        if self.isRunning():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def __serve(self, server):
+        transport, _ = await server.create_serve_endpoint()
+        self.transports[server] = transport
+
+    def __unserve(self, server):
+        transport = self.transports.pop(server, None)
+        if transport is not None:
+            transport.close()
+
+    def __run(self):
+        import asyncio
+
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            for transport in self.transports.values():
+                transport.close()
+            self.transports = {}
+            self.loop.close()
+
+
+class OscSender:
+
+    def __init__(self, ip, port, scheduler, rate=50.0):
+        self.target = (ip, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.scheduler = scheduler
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+
+        self.lock = threading.Lock()
+        self.queued = {}
+        self.flushArmed = False
+        self.lastFlush = 0.0
+
+        # Whole datagrams for the fixed messages, and everything but the float for queued ones.
+        self.datagrams = {}
+        self.prefixes = {}
+
+        self.sent = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def encode(address, value):
+        from pythonosc import osc_message_builder
+
+        builder = osc_message_builder.OscMessageBuilder(address=address)
+        builder.add_arg(value)
+        return builder.build().dgram
+
+    def send(self, address, value):
+        datagram = self.datagrams.get((address, value))
+        if datagram is None:
+            datagram = self.encode(address, value)
+            self.datagrams[(address, value)] = datagram
+
+        # Anything queued has to reach Orac first, before it moves on to another page or module.
+        self.flush()
+        self.socket.sendto(datagram, self.target)
+        self.sent += 1
+
+    def queue(self, address, value):
+        with self.lock:
+            if address in self.queued:
+                self.coalesced += 1
+            self.queued[address] = value
+            if self.flushArmed:
+                return
+            self.flushArmed = True
+            delay = max(0.0, self.lastFlush + self.interval - monotonic())
+
+        self.scheduler.schedule("send", delay, self.flush)
+
+    def flush(self):
+        with self.lock:
+            queued = self.queued
+            if not queued:
+                return
+            self.queued = {}
+            self.flushArmed = False
+            self.lastFlush = monotonic()
+
+        for address, value in queued.items():
+            prefix = self.prefixes.get(address)
+            if prefix is None:
+                prefix = self.encode(address, 0.0)[:-4]
+                self.prefixes[address] = prefix
+            self.socket.sendto(prefix + struct.pack(">f", value), self.target)
+            self.sent += 1
+
+    def stats(self):
+        return "%d sent, %d coalesced" % (self.sent, self.coalesced)
+
+    def close(self):
+        self.flush()
+        self.socket.close()
+
+
+class OscRecorder:
+    MAGIC = b"ORACREC1"
+
+    # Each datagram is stored as the microseconds since the previous one, its length, then its bytes.
+    RECORD = struct.Struct("<IH")
+
+    def __init__(self, path):
+        # Unbuffered, so a recording survives the bridge being killed.
+        self.file = open(path, "wb", buffering=0)
+        self.file.write(OscRecorder.MAGIC)
+        self.lock = threading.Lock()
+        self.last = None
+        self.count = 0
+
+    def record(self, data):
+        now = monotonic()
+        with self.lock:
+            delta = 0 if self.last is None else min(int((now - self.last) * 1e6), 0xFFFFFFFF)
+            self.last = now
+            self.file.write(OscRecorder.RECORD.pack(delta, len(data)) + data)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    @staticmethod
+    def read(path):
+        datagrams = []
+        with open(path, "rb") as file:
+            if file.read(len(OscRecorder.MAGIC)) != OscRecorder.MAGIC:
+                raise ValueError("%s is not an Orac OSC recording" % path)
+            while True:
+                header = file.read(OscRecorder.RECORD.size)
+                if len(header) < OscRecorder.RECORD.size:
+                    break
+                delta, length = OscRecorder.RECORD.unpack(header)
+                datagrams.append((delta / 1e6, file.read(length)))
+        return datagrams
+
+
+class StateView:
+    __slots__ = ("lines", "lineVersions", "selectedLine", "paramNames", "paramValues", "paramCtrls", "paramVersions", "generation")
+
+    def isParamDefined(self, i):
+        return self.paramNames[i] or self.paramValues[i]
+
+
+class StateStore:
+    __slots__ = ("lines", "lineVersions", "selectedLine", "paramNames", "paramValues", "paramCtrls", "paramVersions", "generation",
+                 "linesShared", "paramsShared")
+
+    def __init__(self, lineCount, paramCount):
+        self.lines = [""] * lineCount
+        self.lineVersions = array('L', [0] * lineCount)
+        self.selectedLine = 0
+        self.paramNames = [""] * paramCount
+        self.paramValues = [""] * paramCount
+        self.paramCtrls = array('d', [0.0] * paramCount)
+        self.paramVersions = array('L', [0] * paramCount)
+        self.generation = 0
+
+        # Set while a view refers to the current containers, the next write copies them first.
+        self.linesShared = False
+        self.paramsShared = False
+
+    def view(self, base=None, lines=True, params=True):
+        view = StateView()
+        view.generation = self.generation
+
+        if lines or base is None:
+            view.lines = self.lines
+            view.lineVersions = self.lineVersions
+            view.selectedLine = self.selectedLine
+            self.linesShared = True
+        else:
+            view.lines = base.lines
+            view.lineVersions = base.lineVersions
+            view.selectedLine = base.selectedLine
+
+        if params or base is None:
+            view.paramNames = self.paramNames
+            view.paramValues = self.paramValues
+            view.paramCtrls = self.paramCtrls
+            view.paramVersions = self.paramVersions
+            self.paramsShared = True
+        else:
+            view.paramNames = base.paramNames
+            view.paramValues = base.paramValues
+            view.paramCtrls = base.paramCtrls
+            view.paramVersions = base.paramVersions
+
+        return view
+
+    def ownLines(self):
+        if self.linesShared:
+            self.lines = list(self.lines)
+            self.lineVersions = array('L', self.lineVersions)
+            self.linesShared = False
+        self.generation += 1
+
+    def ownParams(self):
+        if self.paramsShared:
+            self.paramNames = list(self.paramNames)
+            self.paramValues = list(self.paramValues)
+            self.paramCtrls = array('d', self.paramCtrls)
+            self.paramVersions = array('L', self.paramVersions)
+            self.paramsShared = False
+        self.generation += 1
+
+    def setLine(self, i, text):
+        if self.lines[i] == text:
+            return False
+        self.ownLines()
+        self.lines[i] = text
+        self.lineVersions[i] = self.generation
+        return True
+
+    def selectLine(self, i):
+        if self.selectedLine == i:
+            return False
+        self.ownLines()
+        self.selectedLine = i
+        return True
+
+    def clearLines(self):
+        for i in range(len(self.lines)):
+            self.setLine(i, "")
+        return self.generation
+
+    def setParamName(self, i, name):
+        if self.paramNames[i] == name:
+            return False
+        self.ownParams()
+        self.paramNames[i] = name
+        self.paramVersions[i] = self.generation
+        return True
+
+    def setParamValue(self, i, value):
+        if self.paramValues[i] == value:
+            return False
+        self.ownParams()
+        self.paramValues[i] = value
+        self.paramVersions[i] = self.generation
+        return True
+
+    def setParamCtrl(self, i, ctrl):
+        if self.paramCtrls[i] == ctrl:
+            return False
+        self.ownParams()
+        self.paramCtrls[i] = ctrl
+        self.paramVersions[i] = self.generation
+        return True
+
+    def clearParam(self, i):
+        changed = self.setParamName(i, "")
+        changed = self.setParamValue(i, "") or changed
+        return self.setParamCtrl(i, 0.0) or changed
+
+    def clearParams(self):
+        for i in range(len(self.paramNames)):
+            self.clearParam(i)
+        return self.generation
+
+    def loadParams(self, names, values, ctrls):
+        for i in range(len(self.paramNames)):
+            self.setParamName(i, names[i])
+            self.setParamValue(i, values[i])
+            self.setParamCtrl(i, ctrls[i])
+        return self.generation
+
+    def restoreParams(self, view):
+        self.paramNames = view.paramNames
+        self.paramValues = view.paramValues
+        self.paramCtrls = view.paramCtrls
+        self.paramVersions = view.paramVersions
+        self.paramsShared = True
+        self.generation += 1
+
+    def linesChangedSince(self, generation):
+        return max(self.lineVersions) > generation
+
+    def paramsChangedSince(self, generation):
+        return max(self.paramVersions) > generation
+
+    def isParamDefined(self, i):
+        return self.paramNames[i] or self.paramValues[i]
+
+
+class StateChange:
+    __slots__ = ("linesCleared", "lines", "params", "paramCtrls")
+
+    def __init__(self):
+        self.linesCleared = False
+        self.lines = set()
+        self.params = set()
+        self.paramCtrls = set()
+
+    def __bool__(self):
+        return self.linesCleared or bool(self.lines or self.params or self.paramCtrls)
 
 
 class Orac:
     MAX_LINES = 6
     MAX_PARAMS = 8
 
-    def __init__(self, ip, port):
-        self.lines = [""]*Orac.MAX_LINES
-        self.selectedLine = 0
+    # A silent Orac is sent /Connect again after the heartbeat, then twice as long each time it stays silent, up to this.
+    MAX_HEARTBEAT = 120.0
+    # Whatever arrives this soon after a heartbeat's /Connect is taken for Orac's reply to it.
+    CONNECT_REPLY_TIME = 1.0
+
+    def __init__(self, ip, port, listen, engine="asyncio", settleTime=0.2, quietTime=0.01, sendRate=50.0, pageCacheSize=32, oscLoop=None,
+                 heartbeat=15.0):
+        # The live state, written by the OSC handlers, and the view of it listeners were last notified about.
+        self.state = StateStore(Orac.MAX_LINES, Orac.MAX_PARAMS)
+        self.view = self.state.view()
         
         self.runThread = None
 
-        self.params = [{"name": "", "value": "", "ctrl": 0.0} for _ in range(Orac.MAX_PARAMS)]
-
-        self.oscDispatcher = Dispatcher()
+        self.oscDispatcher = OscRouter(self.allOtherHandler)
 
         self.oscDispatcher.map("/text", self.textHandler)
         self.oscDispatcher.map("/selectText", self.selectTextHandler)
         self.oscDispatcher.map("/clearText", self.clearTextHandler)
-        self.oscDispatcher.map("/P*Desc", self.paramDescHandler)
-        self.oscDispatcher.map("/P*Ctrl", self.paramCtrlHandler)
-        self.oscDispatcher.map("/P*Value", self.paramValueHandler)
         self.oscDispatcher.map("/module", self.moduleHandler)
-        self.oscDispatcher.map("/*", self.allOtherHandler)
-
-
-        self.server = ThreadingOSCUDPServer(('', args.listen), self.oscDispatcher)
-
-        self.client = udp_client.SimpleUDPClient(args.ip, args.port)
-        self.client.send_message("/Connect", args.listen)
-        
-        self.linesClearedCallbacks = []
-        self.lineChangedCallbacks = []
-        self.paramNameChangedCallbacks = []
-        self.paramValueChangedCallbacks = []
-        self.paramCtrlChangedCallbacks = []
+        for i in range(Orac.MAX_PARAMS):
+            self.oscDispatcher.map("/P%dDesc" % (i+1), self.paramDescHandler, i)
+            self.oscDispatcher.map("/P%dCtrl" % (i+1), self.paramCtrlHandler, i)
+            self.oscDispatcher.map("/P%dValue" % (i+1), self.paramValueHandler, i)
+
+
+        # The OSC handlers and the settle timers all run on the thread owning the scheduler.
+        if engine == "asyncio":
+            from pythonosc.osc_server import AsyncIOOSCUDPServer
+
+            # All datagrams are handled in order on a single event loop, which may be shared with other Oracs.
+            self.ownsLoop = oscLoop is None
+            self.oscLoop = OscLoop() if oscLoop is None else oscLoop
+            self.loop = self.oscLoop.loop
+            self.scheduler = LoopScheduler(self.loop)
+            self.server = AsyncIOOSCUDPServer(('0.0.0.0', listen), self, self.loop)
+        else:
+            from pythonosc.osc_server import ThreadingOSCUDPServer
+
+            self.ownsLoop = False
+            self.oscLoop = None
+            self.loop = None
+            self.scheduler = TimerScheduler()
+            self.server = ThreadingOSCUDPServer(('', listen), self)
+        self.settleTime = settleTime
+        self.quietTime = quietTime
+
+        self.sender = OscSender(ip, port, self.scheduler, sendRate)
+        self.listen = listen
+
+        # Orac only sends anything when something changes, so if it restarts it's only noticed by it staying silent.
+        self.heartbeat = heartbeat
+        self.heartbeatDelay = heartbeat
+        self.lastReceived = perf_counter()
+        self.lastConnect = 0.0
+        self.reconnects = 0
+
+        self.recorder = None
+        self.statePath = None
+        self.stateInterval = 30.0
+        self.savedView = None
+
+        # Changes are collected per datagram (so per bundle) and per burst, and delivered together.
+        self.changeCallbacks = []
+        self.pending = StateChange()
+        self.pendingSince = None
+        self.pendingReceived = None
+        self.changeDepth = 0
 
         self.lineChangedNotificationsEnabled = True
-        self.screenTimer = None
-        self.linesSnapshot = None
+        self.linesClearedAt = 0
+        self.linesClearedReceived = None
 
         self.paramNotificationsEnabled = True
-        self.paramTimer = None
-        self.paramsSnapshot = None
+        self.paramsClearedAt = 0
 
         self.changingModule = False
+
+        # Pages are counted from the first one shown after /module, and cached by module and page once Orac has settled on them.
+        self.pageCache = LruCache(pageCacheSize)
+        self.module = None
+        self.page = 0
+        self.pageLeft = 0
+        self.paramsSettling = False
+        self.paramsCached = None
+        self.paramsSent = set()
         
     def navigationActivate(self):
-        self.client.send_message("/NavActivate", 1.0)
+        self.sender.send("/NavActivate", 1.0)
 
     def navigationNext(self):
-        self.client.send_message("/NavNext", 1.0)
+        self.sender.send("/NavNext", 1.0)
 
     def navigationPrevious(self):
-        self.client.send_message("/NavPrev", 1.0)
+        self.sender.send("/NavPrev", 1.0)
         
     def clearParams(self, reallyClear):
-        self.paramNotificationsEnabled = False
-
-        if self.paramTimer != None:
-            self.paramTimer.cancel()
-        else:
-            self.paramsSnapshot = self.params.copy()
-
-        self.paramTimer = Timer(0.2, self.handleParamUpdate, args=(reallyClear,))
-        self.paramTimer.start()
+        if not self.scheduler.isOwner():
+            self.scheduler.post(UiEvent.CALL, self.clearParams, reallyClear)
+            return
 
-        self.params = [{"name": "", "value": "", "ctrl": 0.0} for _ in range(Orac.MAX_PARAMS)]
+        self.paramNotificationsEnabled = False
+        self.paramsSettling = True
+        self.paramsCached = None
+        self.paramsSent.clear()
+        self.scheduler.schedule("params", self.settleTime, self.handleParamUpdate, reallyClear)
+        self.paramsClearedAt = self.state.clearParams()
+
+    # Shows a cached page straight away, what Orac sends while settling then updates it in place.
+    def showCachedParams(self, page):
+        if self.paramsCached is None:
+            self.paramsCached = self.view
+        self.paramsSent.clear()
+        self.paramsClearedAt = self.state.loadParams(*page)
+        for i in range(Orac.MAX_PARAMS):
+            self.notifyParamChanged(i)
+            self.notifyParamCtrlChanged(i)
+        self.paramNotificationsEnabled = True
+        self.commitChanges()
 
     def handleParamUpdate(self, reallyClear):
-        if self.params == [{"name": "", "value": "", "ctrl": 0.0} for _ in range(Orac.MAX_PARAMS)]:
+        previous = self.view
+        state = self.state
+        cached = self.paramsCached
+        self.paramsCached = None
+        # What Orac sends may well match the cached page, so it's what was sent that counts rather than what changed.
+        if not (self.paramsSent if cached is not None else state.paramsChangedSince(self.paramsClearedAt)):
             if not reallyClear:
-                self.params = self.paramsSnapshot
+                # Orac didn't change page, so neither did we.
+                self.page = self.pageLeft
+                state.restoreParams(previous if cached is None else cached)
+                if cached is not None:
+                    for i in range(Orac.MAX_PARAMS):
+                        self.notifyParamChanged(i)
+                        self.notifyParamCtrlChanged(i)
+            elif cached is None:
+                for i in range(Orac.MAX_PARAMS):
+                    self.notifyParamChanged(i)
+                    self.notifyParamCtrlChanged(i)
             else:
                 for i in range(Orac.MAX_PARAMS):
-                    self.notifyParamNameChanged(i, "")
-                    self.notifyParamValueChanged(i, "")
-                    self.notifyParamCtrlChanged(i, None)
+                    if state.clearParam(i):
+                        self.notifyParamChanged(i)
+                        self.notifyParamCtrlChanged(i)
+        elif cached is not None:
+            # Whatever the cached page showed and Orac didn't send again is gone.
+            for i in range(Orac.MAX_PARAMS):
+                if i not in self.paramsSent:
+                    if state.clearParam(i):
+                        self.notifyParamChanged(i)
+                        self.notifyParamCtrlChanged(i)
         else:
             for i in range(Orac.MAX_PARAMS):
-                if self.paramsSnapshot[i]["name"] != self.params[i]["name"]:
-                    self.notifyParamNameChanged(i, self.params[i]["name"])
-                if self.paramsSnapshot[i]["value"] != self.params[i]["value"]:
-                    self.notifyParamValueChanged(i, self.params[i]["value"])
-                self.notifyParamCtrlChanged(i, self.params[i]["ctrl"] if self.params[i]["name"] or self.params[i]["value"] else None)
+                if previous.paramVersions[i] != state.paramVersions[i]:
+                    if previous.paramNames[i] != state.paramNames[i] or previous.paramValues[i] != state.paramValues[i]:
+                        self.notifyParamChanged(i)
+                self.notifyParamCtrlChanged(i)
 
         self.paramNotificationsEnabled = True
-        self.paramTimer = None
-        self.paramsSnapshot = None
+        self.paramsSettling = False
+        self.cacheParams()
+        self.commitChanges()
+
+    def cacheParams(self):
+        if self.module is None or self.paramsSettling:
+            return
+        state = self.state
+        if any(state.isParamDefined(i) for i in range(Orac.MAX_PARAMS)):
+            self.pageCache.put((self.module, self.page), (tuple(state.paramNames), tuple(state.paramValues), tuple(state.paramCtrls)))
+        else:
+            self.pageCache.pop((self.module, self.page))
+
+    def turnPage(self, step):
+        if not self.scheduler.isOwner():
+            self.scheduler.post(UiEvent.CALL, self.turnPage, step)
+            return
+
+        self.cacheParams()
+        if not self.paramsSettling:
+            self.pageLeft = self.page
+        self.page += step
+
+        page = self.pageCache.get((self.module, self.page)) if self.module is not None else None
+        if page is None:
+            self.clearParams(False)
+            return
+        self.paramsSettling = True
+        self.scheduler.schedule("params", self.settleTime, self.handleParamUpdate, False)
+        self.showCachedParams(page)
 
     def moduleNext(self):
         self.changingModule = True
-        self.client.send_message("/ModuleNext", 1.0)
+        self.sender.send("/ModuleNext", 1.0)
 
     def modulePrevious(self):
         self.changingModule = True
-        self.client.send_message("/ModulePrev", 1.0)
+        self.sender.send("/ModulePrev", 1.0)
 
     def pageNext(self):
-        self.clearParams(False)
-        self.client.send_message("/PageNext", 1.0)
+        self.turnPage(1)
+        self.sender.send("/PageNext", 1.0)
 
     def pagePrevious(self):
-        self.clearParams(False)
-        self.client.send_message("/PagePrev", 1.0)
+        self.turnPage(-1)
+        self.sender.send("/PagePrev", 1.0)
         
     def paramSet(self, param, value):
         value = max(min(value, 1.0), 0.0)
-        self.client.send_message("/P%dCtrl" % (param+1), value)
-        if self.paramNotificationsEnabled:
-            self.notifyParamCtrlChanged(param, value)
+        self.sender.queue("/P%dCtrl" % (param+1), value)
+        self.scheduler.post(UiEvent.CALL, self.applyParamCtrl, param, value)
 
-    def addLinesClearedCallback(self, cb):
-        self.linesClearedCallbacks.append(cb)
+    # Nothing local is stored while a page settles, or it would be taken for Orac sending the new page.
+    def applyParamCtrl(self, param, value):
+        if self.paramsSettling:
+            return
+        if self.state.setParamCtrl(param, value) and self.paramNotificationsEnabled:
+            self.notifyParamCtrlChanged(param)
+            self.commitChanges()
+
+    # Sets several params at once, as a single change, from the scheduler thread.
+    def paramsSet(self, values):
+        for param, value in values.items():
+            value = max(min(value, 1.0), 0.0)
+            self.sender.queue("/P%dCtrl" % (param+1), value)
+            if not self.paramsSettling and self.state.setParamCtrl(param, value) and self.paramNotificationsEnabled:
+                self.notifyParamCtrlChanged(param)
+        self.commitChanges()
+
+    def addChangeCallback(self, cb):
+        self.changeCallbacks.append(cb)
 
-    def addLineChangedCallback(self, cb):
-        self.lineChangedCallbacks.append(cb)
+    def notifyLinesCleared(self):
+        self.pending.linesCleared = True
 
-    def addParamNameChangedCallback(self, cb):
-        self.paramNameChangedCallbacks.append(cb)
+    def notifyLineChanged(self, line):
+        self.pending.lines.add(line)
 
-    def addParamValueChangedCallback(self, cb):
-        self.paramValueChangedCallbacks.append(cb)
+    def notifyParamChanged(self, i):
+        self.pending.params.add(i)
 
-    def addParamCtrlChangedCallback(self, cb):
-        self.paramCtrlChangedCallbacks.append(cb)
+    def notifyParamCtrlChanged(self, i):
+        self.pending.paramCtrls.add(i)
 
-    def notifyLinesCleared(self):
-        for cb in self.linesClearedCallbacks:
-            cb(self)
+    def beginChanges(self):
+        self.changeDepth += 1
 
-    def notifyLineChanged(self, line, text, selected):
-        for cb in self.lineChangedCallbacks:
-            cb(self, line, text, selected)
+    def endChanges(self):
+        self.changeDepth -= 1
+        if self.changeDepth or not self.pending:
+            return
+
+        if self.quietTime <= 0:
+            self.commitChanges()
+            return
 
-    def notifyParamNameChanged(self, i, name):
-        for cb in self.paramNameChangedCallbacks:
-            cb(self, i, name)
+        # Wait for the burst to go quiet, but never hold a change back for more than a few quiet periods.
+        now = monotonic()
+        if self.pendingSince is None:
+            self.pendingSince = now
+        delay = min(self.quietTime, self.pendingSince + 5 * self.quietTime - now)
+        if delay <= 0:
+            self.commitChanges()
+        else:
+            self.scheduler.schedule("changes", delay, self.commitChanges)
+
+    def commitChanges(self):
+        self.scheduler.cancel("changes")
+        self.pendingSince = None
+        received = self.pendingReceived
+        self.pendingReceived = None
+        change = self.pending
+        if not change:
+            return
+        self.pending = StateChange()
 
-    def notifyParamValueChanged(self, i, value):
-        for cb in self.paramValueChangedCallbacks:
-            cb(self, i, value)
+        start = perf_counter()
+        if received is not None:
+            latency.record("settle", received, start)
 
-    def notifyParamCtrlChanged(self, i, ctrl):
-        for cb in self.paramCtrlChangedCallbacks:
-            cb(self, i, ctrl)
+        self.view = self.state.view(self.view, lines=bool(change.linesCleared or change.lines), params=bool(change.params or change.paramCtrls))
+        latency.changing(received)
+        try:
+            for cb in self.changeCallbacks:
+                cb(self, change)
+        finally:
+            latency.changing(None)
+        latency.record("notify", start)
 
     def run(self):
-        if self.runThread is None or not self.runThread.isAlive():
-            self.runThread = threading.Thread(target=self.__run)
+        self.scheduler.run()
+        if self.heartbeat > 0:
+            self.scheduler.schedule("heartbeat", self.heartbeat, self.checkHeartbeat)
+        if self.oscLoop is not None:
+            self.oscLoop.serve(self.server)
+        elif self.runThread is None or not self.runThread.is_alive():
+            self.runThread = threading.Thread(target=self.server.serve_forever, args=(0.1,))
             self.runThread.start()
+        # Only now that something is listening, or Orac's reply with everything it shows would be lost.
+        self.sender.send("/Connect", self.listen)
 
-    def __run(self):
-        self.server.serve_forever(0.1)
+    def record(self, path):
+        self.recorder = OscRecorder(path)
+
+    def checkHeartbeat(self):
+        silent = perf_counter() - self.lastReceived
+        if silent < self.heartbeatDelay:
+            self.scheduler.schedule("heartbeat", self.heartbeatDelay - silent, self.checkHeartbeat)
+            return
+
+        # Orac sends everything again in reply, which only repaints whatever it missed.
+        self.reconnects += 1
+        self.sender.send("/Connect", self.listen)
+        self.heartbeatDelay = min(2 * self.heartbeatDelay, max(self.heartbeat, Orac.MAX_HEARTBEAT))
+        self.lastReceived = self.lastConnect = perf_counter()
+        self.scheduler.schedule("heartbeat", self.heartbeatDelay, self.checkHeartbeat)
+
+    # Shows the snapshot in path, if there is one, and keeps it up to date from then on.
+    def persist(self, path, interval=30.0):
+        self.statePath = path
+        self.stateInterval = interval
+        snapshot = Orac.loadState(path)
+        if snapshot is not None:
+            self.scheduler.post(UiEvent.CALL, self.restoreState, snapshot)
+        if interval > 0:
+            self.scheduler.schedule("state", interval, self.autosaveState)
+
+    @staticmethod
+    def loadState(path):
+        try:
+            with open(path) as file:
+                snapshot = json.load(file)
+            names, values, ctrls = snapshot["params"]
+            if len(snapshot["lines"]) != Orac.MAX_LINES or not len(names) == len(values) == len(ctrls) == Orac.MAX_PARAMS:
+                raise ValueError("wrong number of lines or params")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print("Ignoring the state in %s: %s" % (path, e))
+            return None
+        return snapshot
+
+    def restoreState(self, snapshot):
+        state = self.state
+        for i, text in enumerate(snapshot["lines"]):
+            if state.setLine(i, text):
+                self.notifyLineChanged(i)
+        previous = state.selectedLine
+        if state.selectLine(snapshot["selected"]):
+            self.notifyLineChanged(previous)
+            self.notifyLineChanged(state.selectedLine)
+        state.loadParams(*snapshot["params"])
+        for i in range(Orac.MAX_PARAMS):
+            self.notifyParamChanged(i)
+            self.notifyParamCtrlChanged(i)
+        self.module = snapshot["module"]
+        self.page = self.pageLeft = snapshot["page"]
+        self.commitChanges()
+        self.savedView = self.view
+
+    def autosaveState(self):
+        self.scheduler.schedule("state", self.stateInterval, self.autosaveState)
+        if self.view is not self.savedView:
+            self.saveState()
+
+    # The view is only ever replaced, never changed, so this is safe from any thread.
+    def saveState(self):
+        view = self.view
+        snapshot = {
+            "lines": view.lines,
+            "selected": view.selectedLine,
+            "module": self.module,
+            "page": self.page,
+            "params": [view.paramNames, view.paramValues, list(view.paramCtrls)],
+        }
+        try:
+            with open(self.statePath + ".tmp", "w") as file:
+                json.dump(snapshot, file, separators=(",", ":"))
+            os.replace(self.statePath + ".tmp", self.statePath)
+        except OSError as e:
+            print("Couldn't save the state to %s: %s" % (self.statePath, e))
+            return
+        self.savedView = view
+
+    # Both servers hand datagrams to here, the threaded one from a new thread per datagram.
+    def call_handlers_for_packet(self, data, client_address):
+        received = perf_counter()
+        if self.recorder is not None:
+            self.recorder.record(data)
+
+        if self.scheduler.isOwner():
+            self.scheduler.apply(UiEvent.OSC, self.handlePacket, data, client_address, received)
+        else:
+            self.scheduler.post(UiEvent.OSC, self.handlePacket, data, client_address, received)
+        return []
+
+    def handlePacket(self, data, client_address, received):
+        start = perf_counter()
+        latency.record("queue", received, start)
+        self.lastReceived = received
+        if self.heartbeatDelay != self.heartbeat and received - self.lastConnect > Orac.CONNECT_REPLY_TIME:
+            # Orac is back, or in use again, rather than only answering the heartbeat, so the next silence is noticed as soon as the first one was.
+            self.heartbeatDelay = self.heartbeat
+            self.scheduler.schedule("heartbeat", self.heartbeat, self.checkHeartbeat)
+
+        # The first datagram of a change is what its latency is measured from.
+        if not self.pending:
+            self.pendingReceived = received
+
+        # A datagram, and so a whole bundle, is applied as one change.
+        self.beginChanges()
+        try:
+            self.oscDispatcher.call_handlers_for_packet(data, client_address)
+        finally:
+            latency.record("dispatch", start)
+            self.endChanges()
 
     def textHandler(self, address, *osc_arguments):
         i = osc_arguments[0]-1
-        if self.lines[i] != osc_arguments[1]:
-            self.lines[i] = osc_arguments[1]
+        if self.state.setLine(i, osc_arguments[1]):
             if self.lineChangedNotificationsEnabled:
-                self.notifyLineChanged(i, self.lines[i], self.selectedLine == i)
+                self.notifyLineChanged(i)
 
     def selectTextHandler(self, address, *osc_arguments):
         i = osc_arguments[0]-1
-        if self.selectedLine != i:
-            if self.lineChangedNotificationsEnabled:
-                self.notifyLineChanged(self.selectedLine, self.lines[self.selectedLine], False)
-            self.selectedLine = i
+        previous = self.state.selectedLine
+        if self.state.selectLine(i):
             if self.lineChangedNotificationsEnabled:
-                self.notifyLineChanged(i, self.lines[i], True)
+                self.notifyLineChanged(previous)
+                self.notifyLineChanged(i)
         
     def handleScreenUpdate(self):
-        if self.lines == [""]*Orac.MAX_LINES:
+        previous = self.view
+        state = self.state
+        if not state.linesChangedSince(self.linesClearedAt):
             self.notifyLinesCleared()
         else:
             for i in range(Orac.MAX_LINES):
-                if self.linesSnapshot[i] != self.lines[i]:
-                    self.notifyLineChanged(i, self.lines[i], i == self.selectedLine)
+                if previous.lineVersions[i] != state.lineVersions[i] and previous.lines[i] != state.lines[i]:
+                    self.notifyLineChanged(i)
 
         self.lineChangedNotificationsEnabled = True
-        self.screenTimer = None
+        self.pendingReceived = self.linesClearedReceived
+        self.commitChanges()
         
     def clearTextHandler(self, address, *osc_arguments):
         if self.changingModule:
+            self.cacheParams()
             self.clearParams(True)
 
         self.lineChangedNotificationsEnabled = False
 
-        if self.screenTimer != None:
-            self.screenTimer.cancel()
-        else:
-            self.linesSnapshot = self.lines.copy()
-
-        self.screenTimer = Timer(0.2, self.handleScreenUpdate)
-        self.screenTimer.start()
-
-        self.lines = [""]*Orac.MAX_LINES
+        self.scheduler.schedule("screen", self.settleTime, self.handleScreenUpdate)
+        self.linesClearedAt = self.state.clearLines()
+        self.linesClearedReceived = self.pendingReceived
 
-    @staticmethod
-    def decodeParamId(oscAddress):
-        return ord(oscAddress[2]) - ord('1')
-
-
-    def paramDescHandler(self, address, *osc_arguments):
-        i = Orac.decodeParamId(address)
-        if self.params[i]["name"] != osc_arguments[0]:
-            self.params[i]["name"] = osc_arguments[0]
+    def paramDescHandler(self, i, *osc_arguments):
+        self.paramsSent.add(i)
+        if self.state.setParamName(i, osc_arguments[0]):
             if self.paramNotificationsEnabled:
-                self.notifyParamNameChanged(i, osc_arguments[0])
+                self.notifyParamChanged(i)
 
-    def paramValueHandler(self, address, *osc_arguments):
-        i = Orac.decodeParamId(address)
-        if self.params[i]["value"] != osc_arguments[0]:
-            self.params[i]["value"] = osc_arguments[0]
+    def paramValueHandler(self, i, *osc_arguments):
+        self.paramsSent.add(i)
+        if self.state.setParamValue(i, osc_arguments[0]):
             if self.paramNotificationsEnabled:
-                self.notifyParamValueChanged(i, osc_arguments[0])
+                self.notifyParamChanged(i)
 
     def moduleHandler(self, address, *osc_arguments):
         self.changingModule = False
+        module = osc_arguments[0] if osc_arguments else None
+        if module == self.module:
+            return
 
-    def paramCtrlHandler(self, address, *osc_arguments):
-        i = Orac.decodeParamId(address)
-        if self.params[i]["ctrl"] != osc_arguments[0]:
-            self.params[i]["ctrl"] = osc_arguments[0]
+        self.cacheParams()
+        self.module = module
+        self.page = self.pageLeft = 0
+        page = self.pageCache.get((module, 0)) if module is not None else None
+        if page is not None:
+            self.paramsSettling = True
+            self.scheduler.schedule("params", self.settleTime, self.handleParamUpdate, True)
+            self.showCachedParams(page)
+
+    def paramCtrlHandler(self, i, *osc_arguments):
+        self.paramsSent.add(i)
+        if self.state.setParamCtrl(i, osc_arguments[0]):
             if self.paramNotificationsEnabled:
-                self.notifyParamCtrlChanged(i, osc_arguments[0])
+                self.notifyParamCtrlChanged(i)
 
     def allOtherHandler(self, address, *osc_arguments):
         pass
         
     def end(self):
-        self.server.server_close()
+        self.sender.close()
+        self.scheduler.stop()
+        if self.statePath is not None and self.view is not self.savedView:
+            self.saveState()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.oscLoop is not None:
+            self.oscLoop.unserve(self.server)
+            if self.ownsLoop:
+                self.oscLoop.stop()
+        else:
+            if self.runThread is not None and self.runThread.is_alive():
+                self.server.shutdown()
+            self.server.server_close()
         
         
 
@@ -384,91 +2371,137 @@ class OracCtl:
         Left        = 27
         Up          = 17
 
-    
+    class Event(IntEnum):
+        RELEASE     = 0
+        PRESS       = 1
+        REPEAT      = 2
 
-    def __init__(self, menu, Controller):
+    REPEATING = (Button.Up, Button.Down, Button.Left, Button.Right)
+
+    def __init__(self, menu, Controller, gpio, scheduler, debounceTime=0.02, repeatDelay=0.4, repeatInterval=0.08):
+        self.menu = menu
+        self.gpio = gpio
         self.blank = menu.blank
         self.paramList = ["" for _ in range(Orac.MAX_PARAMS)]
         self.printList = [""]*Orac.MAX_LINES
         self.highlightList = [""]*Orac.MAX_LINES
                 
-        GPIO.setup(17, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(22, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(4, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(23, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(27, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(6, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(5, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        gpio.setup(17, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.setup(22, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.setup(4, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.setup(23, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.setup(27, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.setup(6, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.setup(5, gpio.IN, pull_up_down=gpio.PUD_UP)
 
         self.inputCallbacks = []
+
+        # Edges are debounced and repeated on the scheduler thread, which owns the UI state.
+        self.scheduler = scheduler
+        self.debounceTime = debounceTime
+        self.repeatDelay = repeatDelay
+        self.repeatInterval = repeatInterval
+        self.lastEdge = {button: 0.0 for button in OracCtl.Button}
+        self.pressedAt = {button: None for button in OracCtl.Button}
         
-        
+    # Called on the GPIO thread, everything else happens on the scheduler thread.
     def inputCallback(self, channel):
-        down = True
-        self.notifyInput(OracCtl.Button(channel), down)
+        self.scheduler.post(UiEvent.BUTTON, self.edgeInput, OracCtl.Button(channel), monotonic())
+
+    def edgeInput(self, button, time):
+        self.lastEdge[button] = time
+        self.scheduler.schedule(("debounce", button), self.debounceTime, self.settleInput, button)
+
+    def settleInput(self, button):
+        down = self.gpio.input(button) == self.gpio.LOW
+        if down == (self.pressedAt[button] is not None):
+            return
+
+        if down:
+            self.pressedAt[button] = self.lastEdge[button]
+            self.notifyInput(button, OracCtl.Event.PRESS, 0.0)
+            if button in OracCtl.REPEATING:
+                self.scheduler.schedule(("repeat", button), self.repeatDelay, self.repeatInput, button)
+        else:
+            held = self.lastEdge[button] - self.pressedAt[button]
+            self.pressedAt[button] = None
+            self.scheduler.cancel(("repeat", button))
+            self.notifyInput(button, OracCtl.Event.RELEASE, held)
+
+    def repeatInput(self, button):
+        if self.pressedAt[button] is None:
+            return
+        self.scheduler.schedule(("repeat", button), self.repeatInterval, self.repeatInput, button)
+        self.notifyInput(button, OracCtl.Event.REPEAT, monotonic() - self.pressedAt[button])
 
     def __del__(self):
         self.clearScreen()
-        GPIO.cleanup()
+        self.gpio.cleanup()
 
     def addInputCallback(self, callback):
         self.inputCallbacks.append(callback)
 
-    def notifyInput(self, button, down):
+    def notifyInput(self, button, event, held):
         for c in self.inputCallbacks:
-            c(self, button, down)
+            c(self, button, event, held)
 
     def printLine(self, line, text, inverted):
 
         self.highlightDefine = 0
         if inverted is True:
             self.highlightDefine = int(line)
-            menu.set_highlight(self.highlightDefine)
+            self.menu.set_highlight(self.highlightDefine)
 
-        if line < 5:
-            self.printList[line] = (text)
-        elif line >= 5:
-            print(text)
-        
-        menu.set_options(self.printList)
+        self.printList[line] = (text)
+        self.menu.set_options(self.printList)
         
         
         
 
+    def printLines(self, lines): # Show just these lines, with nothing highlighted, leaving Orac's lines alone
+        with self.menu.batch():
+            self.menu.set_highlight(None)
+            self.menu.set_options(lines)
+
     def printParam(self, i, name, value, inverted):
         
         self.highlightDefine = 0
         if inverted is True:
             self.highlightDefine = int(i)
-            menu.set_highlight(self.highlightDefine)
+            self.menu.set_highlight(self.highlightDefine)
             
         if not name or not value:
             self.paramList[i] = ("")
         else:
             self.paramList[i] = ("%s: %s" % (name, value))
-        menu.set_options(self.paramList)
+        self.menu.set_options(self.paramList)
         
         
             
         
         
     def printCtrl(self, i, ctrl, inverted): # Print a control data
-        pass
+        self.menu.set_bar(i, ctrl, inverted)
 
 
     def deleteCtrl(self, i): # Clear control data
-        pass
+        self.menu.set_bar(i, None)
 
 
     def clearScreen(self): # Clear OLED with draw.blank()
         self.blank()
 
+    def batch(self): # Show everything printed within as one frame
+        return self.menu.batch()
+
     def setViewMode(self, mode): # <--- set screen width, 128 for ctrl, 104 for params
         if mode != 2:
-            menu.viewWidth = 128
+            self.menu.set_view_width(128)
         else:
-            menu.blank()
-            menu.viewWidth = 128
+            self.menu.set_view_width(104)
+
+    def setPower(self, power): # Dim or switch off the OLED, Menu.Power
+        self.menu.set_power(power)
 
 class Controller:
     class Mode(IntEnum):
@@ -478,24 +2511,23 @@ class Controller:
 
     def __init__(self, orac, oracCtl):
         self.mode = Controller.Mode.UNKNOWN
-        self.lines = [{"text": "", "inverted": False} for _ in range(Orac.MAX_LINES)]
-        self.params = [{"name": "", "value": "", "ctrl": 0.0} for _ in range(Orac.MAX_PARAMS)]
         self.selectedParam = 0
         self.changingParam = None
 
         self.orac = orac
         self.oracCtl = oracCtl
         self.oracCtl.addInputCallback(self.onButtonEvent)
-        self.orac.addLineChangedCallback(self.onLineChanged)
-        self.orac.addLinesClearedCallback(self.onLinesCleared)
-        self.orac.addParamNameChangedCallback(self.onParamNameChanged)
-        self.orac.addParamValueChangedCallback(self.onParamValueChanged)
-        self.orac.addParamCtrlChangedCallback(self.onParamCtrlChanged)
+        self.orac.addChangeCallback(self.onStateChanged)
 
         self.setMode(Controller.Mode.MENU)
 
+    # The state Orac last notified about, shared with Orac rather than mirrored.
+    @property
+    def view(self):
+        return self.orac.view
+
     def isParamDefined(self, param):
-        return self.params[param]["name"] or self.params[param]["value"]
+        return self.view.isParamDefined(param)
 
     def setMode(self, mode):
         if self.mode == mode:
@@ -505,8 +2537,9 @@ class Controller:
         self.oracCtl.setViewMode(mode)
 
         if mode == Controller.Mode.MENU:
+            view = self.view
             for i in range(Orac.MAX_LINES):
-                self.oracCtl.printLine(i, self.lines[i]["text"], self.lines[i]["inverted"])
+                self.oracCtl.printLine(i, view.lines[i], i == view.selectedLine)
                 
         elif mode == Controller.Mode.PARAMS:
             paramFound = False
@@ -515,44 +2548,42 @@ class Controller:
             for i in range(Orac.MAX_PARAMS):
                 if self.isParamDefined(i):
                     paramFound = True
-                    self.oracCtl.printParam(i, self.params[i]["name"], self.params[i]["value"], i == self.selectedParam)
-                    self.oracCtl.printCtrl(i, self.params[i]["ctrl"], i == self.selectedParam)
+                    self.oracCtl.printParam(i, self.view.paramNames[i], self.view.paramValues[i], i == self.selectedParam)
+                    self.oracCtl.printCtrl(i, self.view.paramCtrls[i], i == self.selectedParam)
             if not paramFound:
-                self.oracCtl.printLine(0,"", False)
-                self.oracCtl.printLine(1, "      This module has", False)
-                self.oracCtl.printLine(2, "         no params!", False)
-                self.oracCtl.printLine(3,"", False)
-                self.oracCtl.printLine(4,"", False)
+                self.oracCtl.printLines(["", "      This module has", "         no params!", "", ""])
                 
 
         self.mode = mode
 
+    def onStateChanged(self, sender, change):
+        view = self.view
+        with self.oracCtl.batch():
+            if change.linesCleared:
+                self.onLinesCleared(sender)
+            for i in sorted(change.lines):
+                self.onLineChanged(sender, i, view.lines[i], i == view.selectedLine)
+            for i in sorted(change.params):
+                self.onParamChanged(sender, i)
+            for i in sorted(change.paramCtrls):
+                self.onParamCtrlChanged(sender, i, view.paramCtrls[i] if view.isParamDefined(i) else None)
+
     def onLinesCleared(self, sender):
-        self.lines = [{"text": "", "inverted": False} for _ in range(Orac.MAX_LINES)]
         if self.mode == Controller.Mode.MENU:
             self.oracCtl.clearScreen()
 
     def onLineChanged(self, sender, line, text, inverted):
-        self.lines[line]["text"] = text
-        self.lines[line]["inverted"] = inverted
         if self.mode == Controller.Mode.MENU:
             self.oracCtl.printLine(line, text, inverted)
 
-    def onParamNameChanged(self, sender, i, name):
-        self.params[i]["name"] = name
-        if self.mode == Controller.Mode.PARAMS:
-            self.oracCtl.printParam(i, self.params[i]["name"], self.params[i]["value"], i == self.selectedParam and self.changingParam == None)
-
-    def onParamValueChanged(self, sender, i, value):
-        self.params[i]["value"] = value
+    def onParamChanged(self, sender, i):
         if self.mode == Controller.Mode.PARAMS:
-            self.oracCtl.printParam(i, self.params[i]["name"], self.params[i]["value"], i == self.selectedParam and self.changingParam == None)
+            self.oracCtl.printParam(i, self.view.paramNames[i], self.view.paramValues[i], i == self.selectedParam and self.changingParam == None)
 
     def onParamCtrlChanged(self, sender, i, ctrl):
-        self.params[i]["ctrl"] = ctrl
         if self.mode == Controller.Mode.PARAMS:
             if self.isParamDefined(i):
-                self.oracCtl.printCtrl(i, self.params[i]["ctrl"], i == self.selectedParam)
+                self.oracCtl.printCtrl(i, self.view.paramCtrls[i], i == self.selectedParam)
             else:
                 self.oracCtl.deleteCtrl(i)
 
@@ -565,10 +2596,10 @@ class Controller:
             return
 
         if self.mode == Controller.Mode.PARAMS:
-            self.oracCtl.printParam(prev, self.params[prev]["name"], self.params[prev]["value"], False)
-            self.oracCtl.printCtrl(prev, self.params[prev]["ctrl"], False)
-            self.oracCtl.printParam(self.selectedParam, self.params[self.selectedParam]["name"], self.params[self.selectedParam]["value"], True)
-            self.oracCtl.printCtrl(self.selectedParam, self.params[self.selectedParam]["ctrl"], True)
+            self.oracCtl.printParam(prev, self.view.paramNames[prev], self.view.paramValues[prev], False)
+            self.oracCtl.printCtrl(prev, self.view.paramCtrls[prev], False)
+            self.oracCtl.printParam(self.selectedParam, self.view.paramNames[self.selectedParam], self.view.paramValues[self.selectedParam], True)
+            self.oracCtl.printCtrl(self.selectedParam, self.view.paramCtrls[self.selectedParam], True)
 
     def selectPrevParam(self):
         prev = self.selectedParam
@@ -579,21 +2610,26 @@ class Controller:
             return
 
         if self.mode == Controller.Mode.PARAMS:
-            self.oracCtl.printParam(prev, self.params[prev]["name"], self.params[prev]["value"], False)
-            self.oracCtl.printCtrl(prev, self.params[prev]["ctrl"], False)
-            self.oracCtl.printParam(self.selectedParam, self.params[self.selectedParam]["name"], self.params[self.selectedParam]["value"], True)
-            self.oracCtl.printCtrl(self.selectedParam, self.params[self.selectedParam]["ctrl"], True)
+            self.oracCtl.printParam(prev, self.view.paramNames[prev], self.view.paramValues[prev], False)
+            self.oracCtl.printCtrl(prev, self.view.paramCtrls[prev], False)
+            self.oracCtl.printParam(self.selectedParam, self.view.paramNames[self.selectedParam], self.view.paramValues[self.selectedParam], True)
+            self.oracCtl.printCtrl(self.selectedParam, self.view.paramCtrls[self.selectedParam], True)
 
-    def increaseParam(self, param):
+    # The step doubles for every second Left or Right is held, up to 8 times the normal one.
+    @staticmethod
+    def paramStep(held):
+        return 4 / 127.0 * min(8, 2 ** int(held))
+
+    def increaseParam(self, param, held=0.0):
         if not self.isParamDefined(param):
             return
-        orac.paramSet(param, self.params[param]["ctrl"] + 4 / 127.0)
+        self.orac.paramSet(param, self.view.paramCtrls[param] + Controller.paramStep(held))
         return
 
-    def decreaseParam(self, param):
+    def decreaseParam(self, param, held=0.0):
         if not self.isParamDefined(param):
             return
-        orac.paramSet(param, self.params[param]["ctrl"] - 4 / 127.0)
+        self.orac.paramSet(param, self.view.paramCtrls[param] - Controller.paramStep(held))
         return
 
     def activateParam(self, param):
@@ -601,20 +2637,28 @@ class Controller:
             return
 
         self.changingParam = param
-        self.oracCtl.printParam(param, self.params[param]["name"], self.params[param]["value"], False)
-        self.oracCtl.printCtrl(param, self.params[param]["ctrl"], True)
+        self.oracCtl.printParam(param, self.view.paramNames[param], self.view.paramValues[param], False)
+        self.oracCtl.printCtrl(param, self.view.paramCtrls[param], True)
 
         # Make a dummy change so this param can be mapped.
-        orac.paramSet(param, self.params[param]["ctrl"])
+        self.orac.paramSet(param, self.view.paramCtrls[param])
 
     def deactivateParam(self):
         self.changingParam = None
-        self.oracCtl.printParam(self.selectedParam, self.params[self.selectedParam]["name"], self.params[self.selectedParam]["value"], True)
-        self.oracCtl.printCtrl(self.selectedParam, self.params[self.selectedParam]["ctrl"], True)
+        self.oracCtl.printParam(self.selectedParam, self.view.paramNames[self.selectedParam], self.view.paramValues[self.selectedParam], True)
+        self.oracCtl.printCtrl(self.selectedParam, self.view.paramCtrls[self.selectedParam], True)
+
+    def onButtonEvent(self, sender, button, event, held):
+        with self.oracCtl.batch():
+            self.handleButton(button, event, held)
+
+    def handleButton(self, button, event, held):
+        if event == OracCtl.Event.RELEASE:
+            return
 
-    def onButtonEvent(self, sender, button, down):
-        if not down:
-            print("Not Down")
+        # Only moving through lines and params, and changing a value, repeat while held.
+        repeat = event == OracCtl.Event.REPEAT
+        if repeat and button not in (OracCtl.Button.Up, OracCtl.Button.Down) and self.changingParam == None:
             return
 
         if button == OracCtl.Button.B:
@@ -628,9 +2672,9 @@ class Controller:
                 self.orac.navigationPrevious()
             elif button == OracCtl.Button.Down:
                 self.orac.navigationNext()
-            elif button == OracCtl.Button.Left:
+            elif button == OracCtl.Button.Left and not repeat:
                 self.orac.modulePrevious()
-            elif button == OracCtl.Button.Right:
+            elif button == OracCtl.Button.Right and not repeat:
                 self.orac.moduleNext()
             
         elif self.mode == Controller.Mode.PARAMS:
@@ -643,13 +2687,13 @@ class Controller:
                     self.selectedParam = 0
                     self.orac.pageNext()
                 else:
-                    self.increaseParam(self.selectedParam)
+                    self.increaseParam(self.selectedParam, held)
             elif button == OracCtl.Button.Left:
                 if self.changingParam == None:
                     self.selectedParam = 0
                     self.orac.pagePrevious()
                 else:
-                    self.decreaseParam(self.selectedParam)
+                    self.decreaseParam(self.selectedParam, held)
             elif button == OracCtl.Button.A:
                 if self.changingParam == None:
                     self.activateParam(self.selectedParam)
@@ -658,36 +2702,499 @@ class Controller:
 
 
 
-menu = Menu (["", "", "              Loading...", "", "",])
-orac = Orac(args.ip, args.port)
-oracCtl = OracCtl(menu, Controller)
-ctrl = Controller(orac, oracCtl)
+# Dims the display when nothing has happened for a while, then switches it off, until the next button or change from Orac.
+class IdleManager:
 
-GPIO.add_event_detect(17, GPIO.FALLING, callback=oracCtl.inputCallback, bouncetime=150)
-GPIO.add_event_detect(22, GPIO.FALLING, callback=oracCtl.inputCallback, bouncetime=150)
-GPIO.add_event_detect(4, GPIO.FALLING, callback=oracCtl.inputCallback, bouncetime=150)
-GPIO.add_event_detect(23, GPIO.FALLING, callback=oracCtl.inputCallback, bouncetime=150)
-GPIO.add_event_detect(27, GPIO.FALLING, callback=oracCtl.inputCallback, bouncetime=150)
-GPIO.add_event_detect(6, GPIO.FALLING, callback=oracCtl.inputCallback, bouncetime=150)
-GPIO.add_event_detect(5, GPIO.FALLING, callback=oracCtl.inputCallback, bouncetime=150)
+    def __init__(self, orac, oracCtl, dimAfter=60.0, offAfter=300.0):
+        self.oracCtl = oracCtl
+        self.scheduler = oracCtl.scheduler
+        self.dimAfter = dimAfter
+        self.offAfter = offAfter
+        self.power = Menu.Power.ON
+        self.lastActivity = monotonic()
+
+        self.dims = 0
+        self.offs = 0
+        self.wakes = 0
+
+        oracCtl.addInputCallback(self.onButtonEvent)
+        orac.addChangeCallback(self.onStateChanged)
+        self.scheduler.post(UiEvent.CALL, self.arm)
+
+    # Displays on the same Orac share its scheduler, so each manager has a timer of its own.
+    # The timer isn't moved on every bit of activity, it just checks when it fires whether there has been any since.
+    def arm(self):
+        steps = [(self.dimAfter, Menu.Power.DIM), (self.offAfter, Menu.Power.OFF)]
+        for after, power in steps:
+            if after > 0 and power > self.power:
+                due = self.lastActivity + after
+                self.scheduler.schedule(("idle", self), max(0.0, due - monotonic()), self.idle, power, due)
+                return
+
+    def idle(self, power, due):
+        if self.lastActivity + (self.dimAfter if power == Menu.Power.DIM else self.offAfter) > due:
+            self.arm()
+            return
 
+        self.power = power
+        if power == Menu.Power.DIM:
+            self.dims += 1
+        else:
+            self.offs += 1
+        self.oracCtl.setPower(power)
+        self.arm()
 
-try:
-    
-    print("Server Starting")
+    def activity(self):
+        self.lastActivity = monotonic()
+        if self.power != Menu.Power.ON:
+            self.power = Menu.Power.ON
+            self.wakes += 1
+            self.oracCtl.setPower(Menu.Power.ON)
+            self.arm()
+
+    def onButtonEvent(self, oracCtl, button, event, held):
+        self.activity()
+
+    # A press on buttons belonging to another display, handled on that display's thread, which may not be this one's.
+    def onOtherButtonEvent(self, oracCtl, button, event, held):
+        self.scheduler.post(UiEvent.BUTTON, self.activity)
+
+    def onStateChanged(self, sender, change):
+        self.activity()
+
+    def stats(self):
+        return "dimmed %d times, switched off %d times, woken %d times" % (self.dims, self.offs, self.wakes)
+
+
+# Maps MIDI CCs onto the params. However fast a controller sends, only the latest value of each param is applied,
+# at most rate times a second, so the OSC and render paths see no more than that.
+class MidiInput:
+
+    def __init__(self, orac, source, ccs, channel=None, rate=100.0):
+        self.orac = orac
+        self.scheduler = orac.scheduler
+        self.source = source
+        self.slots = dict((cc, i) for i, cc in enumerate(ccs[:Orac.MAX_PARAMS]))
+        self.channel = channel
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.applyArmed = False
+        self.lastApply = 0.0
+
+        self.received = 0
+        self.coalesced = 0
+
+        source.open(self.onControl)
+
+    # Called on the MIDI thread, channels counted from 0 as on the wire.
+    def onControl(self, cc, value, channel):
+        param = self.slots.get(cc)
+        if param is None or (self.channel is not None and channel != self.channel):
+            return
+
+        with self.lock:
+            self.received += 1
+            if param in self.pending:
+                self.coalesced += 1
+            self.pending[param] = value / 127.0
+            if self.applyArmed:
+                return
+            self.applyArmed = True
+            delay = self.lastApply + self.interval - monotonic()
+
+        if delay > 0:
+            self.scheduler.schedule("midi", delay, self.apply)
+        else:
+            self.scheduler.post(UiEvent.MIDI, self.apply)
+
+    def apply(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.applyArmed = False
+            self.lastApply = monotonic()
+
+        view = self.orac.view
+        values = dict((param, value) for param, value in pending.items() if view.isParamDefined(param))
+        if values:
+            self.orac.paramsSet(values)
+
+    def stats(self):
+        return "%d received, %d coalesced" % (self.received, self.coalesced)
+
+    def close(self):
+        self.source.close()
 
+
+# Publishes what a display shows in a file, normally in /dev/shm, for other processes to map rather than talk to Orac.
+#
+# A header, then the frame in the display's page format, then the state. The frame and the state each start with a
+# generation number, which is odd while they're being written: read it, copy, and read it again until it's even and
+# unchanged. read() does just that.
+class DisplayExport:
+    MAGIC = b"ORACSHM1"
+
+    # Magic, width, height, line count, param count, line size, frame offset, state offset.
+    HEADER = struct.Struct("<8sHHBBHII")
+    HEADER_SIZE = 32
+    GENERATION = struct.Struct("<I")
+
+    # A writer is never halfway through for long, if it is then it's stopped and the section will never be whole.
+    READ_ATTEMPTS = 1000
+
+    # Text is stored as UTF-8, cut to fit and padded with zeros.
+    LINE_SIZE = 64
+    NAME_SIZE = 32
+    VALUE_SIZE = 16
+
+    @staticmethod
+    def stateStruct(lineCount, paramCount, lineSize):
+        # Generation, controller mode, selected line, page, module, the lines, then each param's name, value and control.
+        params = "%ds%dsf" % (DisplayExport.NAME_SIZE, DisplayExport.VALUE_SIZE)
+        return struct.Struct("<IBbh%ds" % DisplayExport.NAME_SIZE + "%ds" % lineSize * lineCount + params * paramCount)
+
+    def __init__(self, path, oled, orac, oracCtl, ctrl):
+        self.path = path
+        self.orac = orac
+        self.ctrl = ctrl
+        self.state = DisplayExport.stateStruct(Orac.MAX_LINES, Orac.MAX_PARAMS, DisplayExport.LINE_SIZE)
+
+        frameSize = oled.pages * oled.width
+        self.frameOffset = DisplayExport.HEADER_SIZE
+        self.stateOffset = (self.frameOffset + DisplayExport.GENERATION.size + frameSize + 7) & ~7
+        size = self.stateOffset + self.state.size
+
+        with open(path, "w+b") as file:
+            file.truncate(size)
+            self.map = mmap.mmap(file.fileno(), size)
+        DisplayExport.HEADER.pack_into(self.map, 0, DisplayExport.MAGIC, oled.width, oled.height, Orac.MAX_LINES, Orac.MAX_PARAMS,
+                                       DisplayExport.LINE_SIZE, self.frameOffset, self.stateOffset)
+        self.frameGeneration = 0
+        self.stateGeneration = 0
+        self.mode = None
+
+        self.writeFrame(bytes(memoryview(oled.buffer)[1:]))
+        self.writeState()
+
+    def writeFrame(self, frame):
+        offset = self.frameOffset
+        start = offset + DisplayExport.GENERATION.size
+        self.frameGeneration += 1
+        DisplayExport.GENERATION.pack_into(self.map, offset, self.frameGeneration)
+        self.map[start:start + len(frame)] = frame
+        self.frameGeneration += 1
+        DisplayExport.GENERATION.pack_into(self.map, offset, self.frameGeneration)
+
+    def writeState(self):
+        view = self.orac.view
+        self.mode = self.ctrl.mode
+        fields = [self.mode, view.selectedLine, self.orac.page, (self.orac.module or "").encode()]
+        fields += [line.encode() for line in view.lines]
+        for i in range(Orac.MAX_PARAMS):
+            fields += [view.paramNames[i].encode(), view.paramValues[i].encode(), view.paramCtrls[i]]
+
+        offset = self.stateOffset
+        self.stateGeneration += 1
+        DisplayExport.GENERATION.pack_into(self.map, offset, self.stateGeneration)
+        self.state.pack_into(self.map, offset, self.stateGeneration, *fields)
+        self.stateGeneration += 1
+        DisplayExport.GENERATION.pack_into(self.map, offset, self.stateGeneration)
+
+    def onStateChanged(self, sender, change):
+        self.writeState()
+
+    def onButtonEvent(self, oracCtl, button, event, held):
+        if self.ctrl.mode != self.mode:
+            self.writeState()
+
+    def close(self):
+        self.map.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    # Returns the frame and the state as a dict, from a consistent copy of each.
+    @staticmethod
+    def read(path):
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, width, height, lineCount, paramCount, lineSize, frameOffset, stateOffset = DisplayExport.HEADER.unpack_from(data, 0)
+            if magic != DisplayExport.MAGIC:
+                raise ValueError("%s is not a bridge export" % path)
+            state = DisplayExport.stateStruct(lineCount, paramCount, lineSize)
+
+            def consistent(offset, size):
+                for _ in range(DisplayExport.READ_ATTEMPTS):
+                    before = DisplayExport.GENERATION.unpack_from(data, offset)[0]
+                    copy = data[offset:offset + size]
+                    if not before & 1 and DisplayExport.GENERATION.unpack_from(data, offset)[0] == before:
+                        return copy
+                    sleep(0.0001)
+                raise TimeoutError("%s was left half written, the bridge writing it has probably stopped" % path)
+
+            frame = consistent(frameOffset, DisplayExport.GENERATION.size + width * height // 8)
+            fields = state.unpack(consistent(stateOffset, state.size))
+        finally:
+            data.close()
+
+        def text(raw):
+            return raw.rstrip(b"\0").decode(errors="ignore")
+
+        params = fields[5 + lineCount:]
+        return frame[DisplayExport.GENERATION.size:], {
+            "frameGeneration": DisplayExport.GENERATION.unpack_from(frame, 0)[0],
+            "generation": fields[0],
+            "mode": fields[1],
+            "selected": fields[2],
+            "page": fields[3],
+            "module": text(fields[4]),
+            "lines": [text(line) for line in fields[5:5 + lineCount]],
+            "params": [(text(params[i]), text(params[i + 1]), params[i + 2]) for i in range(0, len(params), 3)],
+        }
+
+
+# The Oracs and displays to run, from the [orac:NAME] and [display:NAME] sections of --config, with anything
+# not given there taken from the command line. Without a config file it's one of each, as given on the command line.
+def loadConfig(args):
+    import configparser
+
+    config = configparser.ConfigParser()
+    if args.config is not None and not config.read(args.config):
+        parser.error("can't read the config file %s" % args.config)
+
+    oracSections = []
+    displaySections = []
+    for section in config.sections():
+        kind, _, name = section.partition(":")
+        if kind == "orac" and name:
+            oracSections.append((name, config[section]))
+        elif kind == "display" and name:
+            displaySections.append((name, config[section]))
+        else:
+            parser.error("unknown section [%s] in %s, expected [orac:NAME] or [display:NAME]" % (section, args.config))
+    defaults = config[config.default_section]
+
+    oracs = {}
+    for name, values in oracSections or [("orac", defaults)]:
+        oracs[name] = argparse.Namespace(
+            name=name,
+            ip=values.get("ip", args.ip),
+            port=values.getint("port", args.port),
+            listen=values.getint("listen", args.listen),
+        )
+    listens = [orac.listen for orac in oracs.values()]
+    if len(set(listens)) != len(listens):
+        parser.error("every Orac needs its own listen port")
+
+    displays = []
+    for name, values in displaySections or [("display", defaults)]:
+        display = argparse.Namespace(
+            name=name,
+            display=values.get("display", args.display),
+            address=int(values.get("address", "0x3C"), 0),
+            bus=values.getint("bus", 1),
+            orac=values.get("orac", next(iter(oracs))),
+            mode=values.get("mode", "menu"),
+            buttons=values.getboolean("buttons", not displays),
+            renderer=values.get("renderer", args.renderer),
+            row_cache=values.getint("row-cache", args.row_cache),
+            dim_after=values.getfloat("dim-after", args.dim_after),
+            off_after=values.getfloat("off-after", args.off_after),
+        )
+        if display.orac not in oracs:
+            parser.error("display %s is for an unknown Orac %s" % (name, display.orac))
+        if display.mode not in ("menu", "params"):
+            parser.error("display %s has an unknown mode %s, expected menu or params" % (name, display.mode))
+        displays.append(display)
+    if sum(display.buttons for display in displays) > 1:
+        parser.error("only one display can have the buttons")
+
+    return list(oracs.values()), displays
+
+
+def logStartup(stage):
+    elapsed = timeSinceStart()
+    if elapsed is not None:
+        print("%s %.2fs after start" % (stage, elapsed))
+
+
+def main(args):
+    if args.bench_dispatch:
+        benchmarkDispatch()
+        return
+    if args.build_splash:
+        buildSplash(args.build_splash, args.splash)
+        return
+
+    oracConfigs, displayConfigs = loadConfig(args)
+
+    # Create the displays, with their I2C interfaces, and get something on them before loading anything else.
+    oleds = []
+    splash = True
+    for config in displayConfigs:
+        oled = createDisplay(config.display, config.address, config.bus)
+        if not showSplash(oled, args.splash):
+            splash = False
+            oled.fill(0)
+            oled.show()
+            oled.present()
+        oleds.append(oled)
+    logStartup("First pixel")
+
+    # Every display is drawn by the one render thread.
+    renderScheduler = RenderScheduler(args.fps, args.bar_fps, args.marquee_fps)
+    menus = []
+    loading = ["", "", "              Loading...", "", "",]
+    for config, oled in zip(displayConfigs, oleds):
+        menu = Menu(oled, renderScheduler, loading, config.renderer, config.row_cache)
+        threading.Thread(target=menu.prepare, daemon=True).start()
+        menus.append(menu)
+
+    GPIO = createGpio(args.input)
+    GPIO.setmode(GPIO.BCM)
+
+    # And every Orac is handled on the one event loop, or its own threads with the threading engine.
+    oscLoop = OscLoop() if args.osc_engine == "asyncio" and len(oracConfigs) > 1 else None
+    oracs = {}
+    for config in oracConfigs:
+        orac = Orac(config.ip, config.port, config.listen, args.osc_engine, args.settle, args.quiet, args.send_rate, args.page_cache, oscLoop,
+                    args.heartbeat)
+        if args.record:
+            orac.record(args.record if len(oracConfigs) == 1 else "%s.%s" % (args.record, config.name))
+        oracs[config.name] = orac
+
+    controllers = []
+    buttons = None
+    for config, menu in zip(displayConfigs, menus):
+        orac = oracs[config.orac]
+        oracCtl = OracCtl(menu, Controller, GPIO, orac.scheduler, args.debounce, args.repeat_delay, args.repeat_interval)
+        ctrl = Controller(orac, oracCtl)
+        if config.mode == "params":
+            ctrl.setMode(Controller.Mode.PARAMS)
+        else:
+            # The controller starts out showing Orac's lines, which are all blank until it sends some.
+            oracCtl.printLines(loading)
+        idle = IdleManager(orac, oracCtl, config.dim_after, config.off_after)
+        if config.buttons:
+            buttons = oracCtl
+        controllers.append((config, menu, oracCtl, ctrl, idle))
+
+    exports = []
+    if args.export:
+        for config, menu, oracCtl, ctrl, idle in controllers:
+            export = DisplayExport(args.export if len(controllers) == 1 else "%s.%s" % (args.export, config.name), menu.oled, oracs[config.orac], oracCtl, ctrl)
+            menu.flusher.addFlushCallback(export.writeFrame)
+            oracs[config.orac].addChangeCallback(export.onStateChanged)
+            (buttons or oracCtl).addInputCallback(export.onButtonEvent)
+            exports.append(export)
+
+    # MIDI controls the Orac of the display with the buttons, or the first one.
+    midi = None
+    if args.midi:
+        name = next((config.orac for config, menu, oracCtl, ctrl, idle in controllers if oracCtl is buttons), displayConfigs[0].orac)
+        channel = None if args.midi_channel is None else args.midi_channel - 1
+        midi = MidiInput(oracs[name], createMidi(args.midi, args.midi_port), args.midi_cc, channel, args.midi_rate)
+
+    # A press wakes every display, not just the one the buttons control.
+    if buttons is not None:
+        for config, menu, oracCtl, ctrl, idle in controllers:
+            if oracCtl is not buttons:
+                buttons.addInputCallback(idle.onOtherButtonEvent)
+
+    # Show what was on the displays last time, until Orac sends it all again.
+    if args.state:
+        for name, orac in oracs.items():
+            orac.persist(args.state if len(oracs) == 1 else "%s.%s" % (args.state, name), args.state_interval)
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: latency.dump(args.stats))
+    # systemctl stop and shutdown send SIGTERM, which has to clean up, save the state and all, like Ctrl-C.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if buttons is not None:
+        GPIO.add_event_detect(17, GPIO.BOTH, callback=buttons.inputCallback)
+        GPIO.add_event_detect(22, GPIO.BOTH, callback=buttons.inputCallback)
+        GPIO.add_event_detect(4, GPIO.BOTH, callback=buttons.inputCallback)
+        GPIO.add_event_detect(23, GPIO.BOTH, callback=buttons.inputCallback)
+        GPIO.add_event_detect(27, GPIO.BOTH, callback=buttons.inputCallback)
+        GPIO.add_event_detect(6, GPIO.BOTH, callback=buttons.inputCallback)
+        GPIO.add_event_detect(5, GPIO.BOTH, callback=buttons.inputCallback)
+
+
+    status = 0
+    try:
     
-    while True:
-        orac.run()
-        menu.run()
-
-
-finally:
-    menu.end()
-    orac.end()
-    del ctrl
-    del oracCtl
-    del orac
-    GPIO.cleanup()
-    print("Cleaned up and done!")
-    raise SystemExit
+        print("Server Starting")
+
+        if splash:
+            # Leave the splash up until Orac has something to show, or for a couple of seconds after starting.
+            for orac in oracs.values():
+                orac.addChangeCallback(lambda sender, change: renderScheduler.run())
+        else:
+            renderScheduler.run()
+            for menu in menus:
+                menu.markDirty()
+        try:
+            for orac in oracs.values():
+                orac.run()
+        except OSError as e:
+            # Most likely something else has the listen port, and the bridge is no use if Orac can't reach it.
+            print("Couldn't listen for Orac: %s" % e)
+            status = 1
+            return
+        logStartup("Ready")
+
+        # Orac may be slow to start or not there at all, and pressing buttons has to draw something regardless.
+        if splash:
+            def showMenu(menu):
+                renderScheduler.run()
+                menu.markDirty()
+            for config, menu, oracCtl, ctrl, idle in controllers:
+                oracs[config.orac].scheduler.schedule(("splash", menu), 2.0, showMenu, menu)
+
+        # Everything happens on the OSC, GPIO and render threads from here on.
+        while True:
+            sleep(60)
+
+
+    finally:
+        if midi is not None:
+            midi.close()
+        for orac in oracs.values():
+            orac.end()
+        if oscLoop is not None:
+            oscLoop.stop()
+        for menu in menus:
+            menu.end()
+        for export in exports:
+            export.close()
+        several = len(oracs) > 1 or len(menus) > 1
+        for name, orac in oracs.items():
+            label = " %s" % name if several else ""
+            print("Messages to Orac%s: %s, reconnected %d times" % (label, orac.sender.stats(), orac.reconnects))
+            print("Page cache%s: %s" % (label, orac.pageCache.stats()))
+        if midi is not None:
+            print("MIDI: %s" % midi.stats())
+        for config, menu, oracCtl, ctrl, idle in controllers:
+            label = " %s" % config.name if several else ""
+            print("Idle%s: %s" % (label, idle.stats()))
+            print("Sent %d bytes to the display%s in %d frames (%d full)" % (menu.flusher.bytesSent, label, menu.flusher.framesFlushed, menu.flusher.fullFlushes))
+            if isinstance(menu.renderer, PageRenderer):
+                print("Row cache%s: %s" % (label, menu.renderer.rowCache.stats()))
+        del controllers
+        del ctrl
+        del oracCtl
+        del buttons
+        del orac
+        del oracs
+        GPIO.cleanup()
+        latency.dump(args.stats)
+        print("Cleaned up and done!")
+        raise SystemExit(status)
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
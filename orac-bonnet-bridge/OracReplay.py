@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+# Replays recorded or canned Orac OSC traffic through a headless bridge and reports how it keeps up.
+
+import argparse
+import random
+import threading
+from collections import deque
+from time import sleep, monotonic
+
+from pythonosc import osc_message_builder, osc_bundle_builder
+
+from OracBonnetBridge import latency, OscRecorder, MemoryDisplay, FakeGPIO, RenderScheduler, Menu, Orac, OracCtl, Controller
+
+
+parser = argparse.ArgumentParser(description="Replay Orac OSC traffic against the bridge and measure it.")
+parser.add_argument("trace", nargs="*", help="Recordings made with OracBonnetBridge.py --record.")
+parser.add_argument("--canned", action="append", choices=["module", "page", "sweep"], help="Replay a built in trace, can be repeated (default all of them if no recordings are given).")
+parser.add_argument("--fast", action="store_true", help="Replay as fast as possible rather than at the recorded speed.")
+parser.add_argument("--repeat", type=int, default=1, help="How many times to replay each trace.")
+parser.add_argument("--mode", choices=["menu", "params"], default=None, help="The controller mode to replay in (default depends on the trace).")
+parser.add_argument("--osc-engine", choices=["asyncio", "threading"], default="asyncio")
+parser.add_argument("--settle", type=float, default=0.2)
+parser.add_argument("--quiet", type=float, default=0.01)
+parser.add_argument("--renderer", choices=["direct", "pil"], default="direct")
+parser.add_argument("--fps", type=float, default=30.0)
+parser.add_argument("--compare-renderers", type=int, metavar="FRAMES", help="Draw FRAMES random menus with both renderers, check they match pixel for pixel, and exit.")
+
+
+def build(address, *args):
+    builder = osc_message_builder.OscMessageBuilder(address=address)
+    for arg in args:
+        builder.add_arg(arg)
+    return builder.build()
+
+
+def message(address, *args):
+    return build(address, *args).dgram
+
+
+def bundle(*messages):
+    builder = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+    for m in messages:
+        builder.add_content(build(*m))
+    return builder.build().dgram
+
+
+def paramMessages(page, delay):
+    trace = []
+    for i in range(1, Orac.MAX_PARAMS + 1):
+        trace.append((delay, message("/P%dDesc" % i, "Param %d.%d" % (page, i))))
+        trace.append((delay, message("/P%dValue" % i, "%d%%" % (page * 10 + i))))
+        trace.append((delay, message("/P%dCtrl" % i, i / 10.0)))
+    return trace
+
+
+# What Orac sends when a new module is selected: the menu is cleared and redrawn, followed by its parameters.
+def moduleSwitchTrace(count=10):
+    trace = []
+    for n in range(count):
+        trace.append((0.5, message("/clearText")))
+        for i in range(1, Orac.MAX_LINES + 1):
+            trace.append((0.0005, message("/text", i, "Module %d item %d" % (n, i))))
+        trace.append((0.0005, message("/selectText", 1)))
+        trace.append((0.0005, message("/module", "module%d" % n)))
+        trace += paramMessages(0, 0.0005)
+    return trace
+
+
+def pageFlipTrace(count=20):
+    trace = []
+    for n in range(count):
+        page = paramMessages(n % 4, 0.0002)
+        trace.append((0.25, page[0][1]))
+        trace += page[1:]
+    return trace
+
+
+def knobSweepTrace(steps=200):
+    trace = paramMessages(0, 0.0002)
+    for n in range(steps):
+        value = n / (steps - 1)
+        trace.append((0.01, bundle(("/P1Value", "%d%%" % int(value * 100)), ("/P1Ctrl", value))))
+    return trace
+
+
+CANNED = {
+    "module" : ("menu", moduleSwitchTrace),
+    "page"   : ("params", pageFlipTrace),
+    "sweep"  : ("params", knobSweepTrace),
+}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+class ReplayOrac(Orac):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.injected = deque()
+        self.handled = []
+
+    def handlePacket(self, data, client_address, received):
+        super().handlePacket(data, client_address, received)
+        self.handled.append(self.injected.popleft())
+
+
+class ReplayMenu(Menu):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.waiting = []
+        self.latencies = []
+
+    def render(self):
+        with self.lock:
+            covered = self.waiting
+            self.waiting = []
+        super().render()
+        now = monotonic()
+        self.latencies.extend(now - t for t in covered)
+
+
+# Both renderers have to scroll a marquee to the same place, however long apart they draw it.
+class CompareMenu(Menu):
+    offset = 0
+
+    def marqueeOffset(self, text, renderer):
+        return CompareMenu.offset % (renderer.textWidth(text) + Menu.MARQUEE_GAP)
+
+
+class Replay:
+
+    def __init__(self, args, mode):
+        self.oled = MemoryDisplay()
+        self.renderScheduler = RenderScheduler(args.fps)
+        self.menu = ReplayMenu(self.oled, self.renderScheduler, [], args.renderer)
+        self.orac = ReplayOrac("127.0.0.1", 9, 0, args.osc_engine, args.settle, args.quiet)
+        self.oracCtl = OracCtl(self.menu, Controller, FakeGPIO(), self.orac.scheduler)
+        self.ctrl = Controller(self.orac, self.oracCtl)
+        if mode == "params":
+            self.ctrl.setMode(Controller.Mode.PARAMS)
+
+        self.notifications = 0
+        self.orac.addChangeCallback(self.onStateChanged)
+
+        self.orac.run()
+        self.renderScheduler.run()
+
+    def onStateChanged(self, sender, change):
+        self.notifications += 1
+        handled = self.orac.handled
+        self.orac.handled = []
+        with self.menu.lock:
+            self.menu.waiting.extend(handled)
+
+    # Returns how long the datagrams took to be handled, and until the last change was drawn.
+    def play(self, trace, fast):
+        start = monotonic()
+        due = start
+        for delay, data in trace:
+            if not fast:
+                due += delay
+                wait = due - monotonic()
+                if wait > 0:
+                    sleep(wait)
+            self.orac.injected.append(monotonic())
+            self.orac.call_handlers_for_packet(data, ("127.0.0.1", 0))
+
+        while self.orac.injected:
+            sleep(0.001)
+        handled = monotonic() - start
+
+        # Let the last change settle and be drawn.
+        frames = -1
+        while frames != len(self.oled.flushes):
+            frames = len(self.oled.flushes)
+            sleep(self.orac.settleTime + 0.1)
+        drawn = self.oled.flushes[-1][0] - start if frames else handled
+        return handled, max(handled, drawn)
+
+    def end(self):
+        self.menu.end()
+        self.orac.end()
+
+
+def report(name, messages, handled, drawn, replay, frames):
+    latencies = [t * 1000 for t in replay.menu.latencies]
+    print("%s: %d datagrams handled in %.3fs (%.0f msg/s), drawn after %.3fs (%.1f notifications/s, %.1f repaints/s)" % (
+        name, messages, handled, messages / max(handled, 1e-6), drawn, replay.notifications / drawn, frames / drawn))
+    print("    latency ms: p50 %.2f, p90 %.2f, p99 %.2f, max %.2f over %d datagrams" % (
+        percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99), max(latencies or [0]), len(latencies)))
+
+
+def randomText():
+    length = random.choice([random.randint(0, 12), random.randint(0, 40)])
+    return "".join(random.choice(" 0123456789%:.-abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(length))
+
+
+# Makes the same random changes to a menu drawn through PIL and one drawn directly, redrawing them incrementally
+# as the bridge does, and compares what ends up on their displays.
+def compareRenderers(frames, seed=1):
+    random.seed(seed)
+    scheduler = RenderScheduler()
+    menus = [CompareMenu(MemoryDisplay(), scheduler, [], renderer) for renderer in ("pil", "direct")]
+
+    options = []
+    mismatches = 0
+    for frame in range(frames):
+        changes = []
+        if random.random() < 0.05:
+            changes.append(("set_view_width", random.choice([128, 104])))
+        chance = random.random()
+        if chance < 0.1 or not options:
+            options = [randomText() for _ in range(random.randint(0, 12))]
+        elif chance < 0.6:
+            options[random.randrange(len(options))] = randomText()
+        changes.append(("set_options", options))
+        changes.append(("set_highlight", random.choice([None] + list(range(-1, len(options) + 1)))))
+        for i in range(len(options)):
+            if random.random() < 0.3:
+                changes.append(("set_bar", i, random.choice([None, random.random()]), random.random() < 0.2))
+        CompareMenu.offset = random.randrange(300) if random.random() < 0.3 else 0
+        barsFirst = random.random() < 0.3
+
+        for menu in menus:
+            with menu.batch():
+                for change in changes:
+                    getattr(menu, change[0])(*change[1:])
+            if barsFirst:
+                menu.renderBars()
+            menu.render()
+
+        pil, direct = (menu.oled for menu in menus)
+        if pil.ram != direct.ram:
+            mismatches += 1
+            if mismatches <= 3:
+                print("frame %d differs: %r" % (frame, menus[0].frame.options))
+
+    print("%d of %d frames differ between the PIL and direct renderers" % (mismatches, frames))
+    return mismatches
+
+
+def main(args):
+    if args.compare_renderers:
+        raise SystemExit(1 if compareRenderers(args.compare_renderers) else 0)
+
+    traces = []
+    for path in args.trace:
+        traces.append((path, args.mode or "menu", OscRecorder.read(path)))
+    for name in args.canned or ([] if args.trace else sorted(CANNED)):
+        mode, build = CANNED[name]
+        traces.append((name, args.mode or mode, build()))
+
+    for name, mode, trace in traces:
+        replay = Replay(args, mode)
+        try:
+            messages = 0
+            handled = drawn = 0.0
+            frames = len(replay.oled.flushes)
+            for _ in range(args.repeat):
+                h, d = replay.play(trace, args.fast)
+                handled += h
+                drawn += d
+                messages += len(trace)
+            report(name, messages, handled, drawn, replay, len(replay.oled.flushes) - frames)
+        finally:
+            replay.end()
+
+    print("\nPer stage, over all the traces:")
+    latency.dump()
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())